@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+#
+# Copyright 2015-2024 Flavio Garcia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compares the per call cost of cartola.config.log_level_from_string with the
+implementation building the levels dict on every call.
+
+Run from the project root:
+    PYTHONPATH=. python benchmarks/config_log_level.py
+"""
+
+from cartola import config
+import logging
+import timeit
+
+NUMBER = 200000
+VALUES = ("INFO", "warning", "NOT_A_LEVEL", logging.ERROR)
+
+
+def previous_log_level_from_string(str_level):
+    levels = {
+        'CRITICAL': logging.CRITICAL,
+        'ERROR': logging.ERROR,
+        'WARNING': logging.WARNING,
+        'WARN': logging.WARNING,
+        'INFO': logging.INFO,
+        'DEBUG': logging.DEBUG,
+        'NOTSET': logging.NOTSET,
+    }
+    try:
+        return levels[str_level.upper()]
+    except KeyError:
+        pass
+    except AttributeError:
+        if str_level in [logging.DEBUG, logging.INFO, logging.WARNING,
+                         logging.ERROR, logging.CRITICAL]:
+            return str_level
+    return logging.NOTSET
+
+
+def main():
+    for value in VALUES:
+        for name, function in (
+                ("previous", previous_log_level_from_string),
+                ("current", config.log_level_from_string)):
+            elapsed = min(timeit.repeat(lambda: function(value),
+                                        number=NUMBER, repeat=3))
+            print("%-14r %-9s %.1fns per call" % (
+                value, name, elapsed / NUMBER * 1e9))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+#
+# Copyright 2015-2024 Flavio Garcia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compares the pure python and libyaml safe loaders used by
+cartola.config.load_yaml_file parsing tests/fixtures/a_file.yml scaled up.
+
+Run from the project root:
+    PYTHONPATH=. python benchmarks/config_yaml_loader.py
+"""
+
+from cartola import config
+import copy
+import os
+import tempfile
+import timeit
+import yaml
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+FIXTURE = os.path.join(ROOT, "tests", "fixtures", "a_file.yml")
+SCALES = (1000, 10000, 50000)
+REPEAT = 3
+
+
+def scaled_fixture(scale):
+    """ Return a yaml document with the fixture repeated scale times. """
+    fixture = config.load_yaml_file(FIXTURE)
+    # Copying the fixture for each key so the dump has no yaml aliases
+    return yaml.safe_dump({"key_%d" % i: copy.deepcopy(fixture)
+                           for i in range(scale)})
+
+
+def load(path, loader):
+    with open(path, "r") as stream:
+        return yaml.load(stream, Loader=loader)
+
+
+def main():
+    loaders = [("python", yaml.SafeLoader)]
+    if yaml.__with_libyaml__:
+        loaders.append(("libyaml", yaml.CSafeLoader))
+    print("load_yaml_file backend: %s" % config.yaml_backend())
+    for scale in SCALES:
+        fd, path = tempfile.mkstemp(suffix=".yml")
+        with os.fdopen(fd, "w") as f:
+            f.write(scaled_fixture(scale))
+        size = os.path.getsize(path)
+        try:
+            for name, loader in loaders:
+                elapsed = min(timeit.repeat(
+                    lambda: load(path, loader), number=1, repeat=REPEAT))
+                print("%8d keys %10d bytes %-8s %.4fs" % (scale, size, name,
+                                                          elapsed))
+        finally:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
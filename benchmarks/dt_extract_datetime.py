@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+#
+# Copyright 2015-2024 Flavio Garcia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compares cartola.dt.extract_datetime, using masks compiled by
+cartola.dt.compile_mask, with datetime.strptime.
+
+Run from the project root:
+    PYTHONPATH=. python benchmarks/dt_extract_datetime.py
+"""
+
+from cartola import dt
+from datetime import datetime
+import timeit
+
+NUMBER = 100000
+CASES = (
+    ("%Y-%m-%d", "2020-02-29"),
+    ("%Y-%m-%d %H:%M:%S", "2020-02-29 13:14:15"),
+    ("%Y-%m-%dT%H:%M:%S.%f", "2020-02-29T13:14:15.123456"),
+    ("%d/%m/%Y", "29/02/2020"),
+    ("%d %b %Y", "29 Feb 2020"),
+)
+
+
+def main():
+    for mask, value in CASES:
+        record = {'value': value}
+        strptime = min(timeit.repeat(
+            lambda: datetime.strptime(record['value'], mask),
+            number=NUMBER, repeat=3))
+        extract = min(timeit.repeat(
+            lambda: dt.extract_datetime(record, "value", mask),
+            number=NUMBER, repeat=3))
+        print("%-22s strptime %6.0fns extract_datetime %6.0fns %5.1fx" % (
+            mask, strptime / NUMBER * 1e9, extract / NUMBER * 1e9,
+            strptime / extract))
+
+
+if __name__ == "__main__":
+    main()
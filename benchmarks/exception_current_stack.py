@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+#
+# Copyright 2015-2024 Flavio Garcia
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compares cartola.exception.current_stack with the implementation raising a
+ZeroDivisionError to get the current frame.
+
+Run from the project root:
+    PYTHONPATH=. python benchmarks/exception_current_stack.py
+"""
+
+from cartola import exception
+import sys
+import timeit
+
+NUMBER = 20000
+DEPTHS = (10, 50)
+
+
+def previous_current_stack(skip=0):
+    try:
+        1/0
+    except ZeroDivisionError:
+        f = sys.exc_info()[2].tb_frame
+    for i in range(skip + 2):
+        f = f.f_back
+    lst = []
+    while f is not None:
+        lst.append((f, f.f_lineno))
+        f = f.f_back
+    return lst
+
+
+def at_depth(depth, function):
+    if depth > 0:
+        return at_depth(depth - 1, function)
+    return function()
+
+
+def main():
+    cases = (
+        ("baseline recursion", lambda: None),
+        ("previous", lambda: previous_current_stack()),
+        ("current", lambda: exception.current_stack()),
+        ("current max_depth=5", lambda: exception.current_stack(
+            max_depth=5)),
+        # The lazy iterators are consumed, creating them walks nothing
+        ("current lazy", lambda: list(exception.current_stack(lazy=True))),
+        ("current lazy first", lambda: next(exception.current_stack(
+            lazy=True))),
+    )
+    for depth in DEPTHS:
+        for name, function in cases:
+            elapsed = min(timeit.repeat(
+                lambda: at_depth(depth, function), number=NUMBER, repeat=3))
+            print("depth %3d %-20s %.2fus per call" % (
+                depth, name, elapsed / NUMBER * 1e6))
+
+
+if __name__ == "__main__":
+    main()
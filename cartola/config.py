@@ -14,30 +14,841 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import ctypes
+import ctypes.util
+import hashlib
 import importlib
-import yaml
 import logging
+import marshal
+import os
+import select
+import struct
+import sys
+import threading
+import time
+import yaml
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+_NOT_CACHED = object()
+
+# Prefer the libyaml based loader, it is many times faster than the pure
+# python one. PyYAML only exposes CSafeLoader when it was built with libyaml.
+try:
+    from yaml import CSafeLoader as YamlSafeLoader
+    YAML_BACKEND = "libyaml"
+except ImportError:
+    from yaml import SafeLoader as YamlSafeLoader
+    YAML_BACKEND = "python"
+
+
+def yaml_backend():
+    """ Return the backend used to parse yaml files by load_yaml_file.
+
+    :return str: Either "libyaml" or "python".
+    """
+    return YAML_BACKEND
 
 
 def load_yaml_file(path):
     """ Returns the parsed structure from a yaml config file.
 
+    The file is parsed with the safe loader backed by libyaml when available,
+    falling back to the pure python safe loader. See yaml_backend.
+
     :param path: Path where the yaml file is located.
     :return: The yaml configuration represented by the yaml file.
     """
     result = None
     with open(path, 'r') as steam:
-        result = yaml.safe_load(steam)
+        result = yaml.load(steam, Loader=YamlSafeLoader)
     return result
 
 
-def get_from_module(module, attr_name):
+def _get_by_key_path(data, keys):
+    for key in keys:
+        if isinstance(data, dict):
+            if key not in data:
+                return _MISSING
+            data = data[key]
+        elif isinstance(data, list):
+            try:
+                data = data[int(key)]
+            except (ValueError, IndexError):
+                return _MISSING
+        else:
+            return _MISSING
+    return data
+
+
+def iter_yaml_file(path, key_path=None):
+    """ Yields the parsed documents from a multi-document yaml file one at a
+    time, so large files can be processed without loading all documents in
+    memory.
+
+    If a key path is informed only the value found in that path will be
+    yielded from each document. Documents without the key path are skipped.
+    The key path is a dot separated list of keys, list indexes can be used
+    as keys.
+
+    Example:
+    >>> for host in iter_yaml_file("inventory.yml"):
+    >>>     print(host['name'])
+    >>> for address in iter_yaml_file("inventory.yml", "network.address"):
+    >>>     print(address)
+
+    :param str path: Path where the yaml file is located.
+    :param str key_path: Dot separated path used to filter the documents.
+    :return: The documents or values found in the key path.
+    """
+    keys = None if key_path is None else key_path.split(".")
+    with open(path, 'r') as steam:
+        for document in yaml.load_all(steam, Loader=YamlSafeLoader):
+            if keys is None:
+                yield document
+                continue
+            value = _get_by_key_path(document, keys)
+            if value is not _MISSING:
+                yield value
+
+
+def _stat_signature(path):
+    """ Return the stat information used to detect if a file was changed.
+
+    :param str path: The file path.
+    :return tuple: The file mtime in nanoseconds, size and inode.
+    """
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class ConfigCache(object):
+    """ Memoizes the parsed structure of yaml config files by path.
+
+    The cached structure is returned while the file mtime, size and inode
+    remain the same, so a repeated load costs a single stat call instead of a
+    full yaml parse. When the cache grows beyond max_size the least recently
+    used path is evicted.
+
+    The structure returned is shared between all callers loading the same
+    path, it must be treated as read only.
+
+    Example:
+    >>> cache = ConfigCache(max_size=32)
+    >>> conf = cache.load("conf/app.yml")
+    >>> cache.stats
+    {'hits': 0, 'misses': 1, 'reparses': 0, 'size': 1}
+    """
+
+    def __init__(self, max_size=128, loader=None):
+        """
+        :param int max_size: Maximum number of paths kept in the cache.
+        :param callable loader: Function used to parse a path. Default is
+        load_yaml_file.
+        """
+        self._max_size = max_size
+        self._loader = load_yaml_file if loader is None else loader
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._reparses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def stats(self):
+        """ Return the cache counters.
+
+        :return dict: Hits, misses, reparses and the current cache size.
+        """
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'reparses': self._reparses,
+                'size': len(self._entries),
+            }
+
+    def load(self, path):
+        """ Return the parsed structure from a config file, parsing it only
+        if the file is not cached or was changed since the last parse.
+
+        :param str path: Path where the config file is located.
+        :return: The parsed structure.
+        """
+        path = os.path.abspath(path)
+        signature = _stat_signature(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(path)
+                self._hits += 1
+                return entry[1]
+            if entry is None:
+                self._misses += 1
+            else:
+                self._reparses += 1
+        # Parsing outside the lock, so loads from other paths aren't blocked
+        data = self._loader(path)
+        with self._lock:
+            self._entries[path] = (signature, data)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+        return data
+
+    def invalidate(self, path=None):
+        """ Remove a path from the cache. If no path is informed the cache
+        will be cleared.
+
+        :param str path: The path to be removed from the cache.
+        """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                return
+            self._entries.pop(os.path.abspath(path), None)
+
+
+SNAPSHOT_EXTENSION = ".snapshot"
+SNAPSHOT_MAGIC = b"CRTS"
+# Magic, marshal version, sha256 digest of the yaml file and the stat
+# signature(mtime_ns, size, inode) of the yaml file.
+_SNAPSHOT_HEADER = struct.Struct("<4sB32sQQQ")
+
+
+def _snapshot_header(digest, signature):
+    return _SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, marshal.version, digest,
+                                 *signature)
+
+
+def _write_snapshot(snapshot_path, digest, signature, data):
+    """ Write a snapshot file atomically. Returns False if the data can't be
+    marshaled or the file can't be written.
+    """
+    try:
+        payload = marshal.dumps(data)
+    except ValueError:
+        logger.debug("The data from %s can't be written as a snapshot.",
+                     snapshot_path)
+        return False
+    temp_path = "%s.%d.tmp" % (snapshot_path, os.getpid())
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(_snapshot_header(digest, signature))
+            f.write(payload)
+        os.replace(temp_path, snapshot_path)
+    except OSError as error:
+        logger.warning("Unable to write the snapshot %s: %s", snapshot_path,
+                       error)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+    return True
+
+
+def write_yaml_snapshot(path, snapshot_path=None):
+    """ Parse a yaml file and write a compiled snapshot of the parsed
+    structure keyed by the file content hash.
+
+    The snapshot is written using marshal, so only structures with
+    dicts, lists, sets, strings, bytes, numbers, booleans and None can be
+    written. Yaml files resolving dates and timestamps won't be written.
+
+    :param str path: Path where the yaml file is located.
+    :param str snapshot_path: Path where the snapshot will be written. By
+    default the yaml path with the SNAPSHOT_EXTENSION.
+    :return bool: True if the snapshot was written.
+    """
+    if snapshot_path is None:
+        snapshot_path = "%s%s" % (path, SNAPSHOT_EXTENSION)
+    signature = _stat_signature(path)
+    with open(path, "rb") as f:
+        source = f.read()
+    data = yaml.load(source, Loader=YamlSafeLoader)
+    return _write_snapshot(snapshot_path, hashlib.sha256(source).digest(),
+                           signature, data)
+
+
+def load_yaml_snapshot(path, snapshot_path=None, write=True):
+    """ Returns the parsed structure from a yaml config file using a compiled
+    snapshot when it matches the file.
+
+    If the yaml file stat is the same recorded in the snapshot, the structure
+    is loaded with a single read of the snapshot. When the stat differs the
+    yaml file content hash is checked against the snapshot before parsing
+    the file again, so copying the same files during a deploy won't trigger
+    a new parse.
+
+    The snapshot is loaded with marshal and must be trusted as much as the
+    yaml file it is written next to.
+
+    :param str path: Path where the yaml file is located.
+    :param str snapshot_path: Path where the snapshot is located. By
+    default the yaml path with the SNAPSHOT_EXTENSION.
+    :param bool write: If the snapshot should be written or refreshed when
+    it doesn't match the yaml file.
+    :return: The yaml configuration represented by the yaml file.
+    """
+    if snapshot_path is None:
+        snapshot_path = "%s%s" % (path, SNAPSHOT_EXTENSION)
+    signature = _stat_signature(path)
+    snapshot = None
+    try:
+        with open(snapshot_path, "rb") as f:
+            snapshot = f.read()
+    except OSError:
+        pass
+    data = None
+    digest = None
+    if snapshot is not None and len(snapshot) > _SNAPSHOT_HEADER.size:
+        header = _SNAPSHOT_HEADER.unpack_from(snapshot)
+        if header[0] == SNAPSHOT_MAGIC and header[1] == marshal.version:
+            digest = header[2]
+            try:
+                data = marshal.loads(snapshot[_SNAPSHOT_HEADER.size:])
+            except (EOFError, ValueError, TypeError):
+                digest = None
+            if digest is not None and header[3:] == signature:
+                return data
+    with open(path, "rb") as f:
+        source = f.read()
+    source_digest = hashlib.sha256(source).digest()
+    if source_digest != digest:
+        data = yaml.load(source, Loader=YamlSafeLoader)
+    if write:
+        _write_snapshot(snapshot_path, source_digest, signature, data)
+    return data
+
+
+def _merge_layers(values):
+    """ Merge the values from each layer for the same key, the last layer
+    wins. Dicts are merged recursively and a value defined by a single layer
+    is returned as is, shared instead of copied.
+
+    :param list values: The values from each layer, _MISSING if the layer
+    doesn't define the key.
+    :return: The merged value or _MISSING.
+    """
+    dicts = []
+    for value in reversed(values):
+        if value is _MISSING:
+            continue
+        if not isinstance(value, dict):
+            if not dicts:
+                return value
+            break
+        dicts.append(value)
+    if not dicts:
+        return _MISSING
+    if len(dicts) == 1:
+        return dicts[0]
+    dicts.reverse()
+    merged = {}
+    for layer_dict in dicts:
+        for key in layer_dict:
+            if key not in merged:
+                merged[key] = _merge_layers(
+                    [item.get(key, _MISSING) for item in dicts])
+    return merged
+
+
+def _layer_data(name, data):
+    """ Return the layer data with None normalized to an empty dict, raising
+    TypeError if it isn't a dict.
+    """
+    if data is None:
+        return {}
+    if not isinstance(data, dict):
+        raise TypeError("The layer %s data must be a dict." % name)
+    return data
+
+
+class LayeredConfig(object):
+    """ Merges configuration layers, like base config, environment overlays
+    and host overrides, into a single structure.
+
+    Layers are merged in the order they were added, the last layer wins.
+    Dicts are merged structurally and subtrees defined by a single layer are
+    shared with the layer instead of copied, so the merged structure must be
+    treated as read only.
+
+    When a layer changes only the top level keys changed by the layer are
+    merged again. Readers holding the previous merged structure are not
+    affected by the update.
+
+    Example:
+    >>> conf = LayeredConfig()
+    >>> conf.add_layer("base", path="conf/base.yml")
+    >>> conf.add_layer("production", path="conf/production.yml")
+    >>> conf.add_layer("host", {'debug': True})
+    >>> conf['debug']
+    True
+    >>> conf.reload()
+    ['production']
+    """
+
+    def __init__(self, cache=None):
+        """
+        :param ConfigCache cache: Cache used to load the layers from files.
+        """
+        self._cache = ConfigCache() if cache is None else cache
+        self._names = []
+        self._layers = {}
+        self._paths = {}
+        # The objects returned by the cache for the layers loaded from files
+        self._sources = {}
+        self._data = {}
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    @property
+    def data(self):
+        """ Return the merged structure. """
+        return self._data
+
+    @property
+    def names(self):
+        """ Return the layer names from the bottom to the top layer. """
+        return list(self._names)
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def layer(self, name):
+        """ Return the data from a layer. """
+        return self._layers[name]
+
+    def add_layer(self, name, data=None, path=None):
+        """ Add a layer on top of the existing layers. The layer data can be
+        informed directly or loaded from a yaml file path.
+
+        :param str name: The layer name.
+        :param dict data: The layer data.
+        :param str path: Path where the layer yaml file is located.
+        :return set: The top level keys merged again.
+        """
+        with self._lock:
+            if name in self._layers:
+                raise ValueError("The layer %s was already added." % name)
+            source = None
+            if path is not None:
+                source = data = self._cache.load(path)
+            # Validating before registering the layer
+            data = _layer_data(name, data)
+            if path is not None:
+                self._paths[name] = path
+                self._sources[name] = source
+            self._names.append(name)
+            self._layers[name] = {}
+            return self._update(name, data)
+
+    def update_layer(self, name, data):
+        """ Replace the data from a layer.
+
+        :param str name: The layer name.
+        :param dict data: The new layer data.
+        :return set: The top level keys merged again.
+        """
+        with self._lock:
+            if name not in self._layers:
+                raise KeyError(name)
+            return self._update(name, data)
+
+    def remove_layer(self, name):
+        """ Remove a layer.
+
+        :param str name: The layer name.
+        :return set: The top level keys merged again.
+        """
+        with self._lock:
+            # An empty layer doesn't affect the merge anymore
+            keys = self._update(name, {})
+            self._names.remove(name)
+            del self._layers[name]
+            self._paths.pop(name, None)
+            self._sources.pop(name, None)
+            return keys
+
+    def reload(self):
+        """ Load again the layers added from files that changed since they
+        were loaded.
+
+        :return list: The names of the layers changed.
+        """
+        changed = []
+        with self._lock:
+            for name, path in list(self._paths.items()):
+                source = self._cache.load(path)
+                # Compared with the cached object, data from an empty file
+                # is normalized to a new dict
+                if source is not self._sources[name]:
+                    self._update(name, source)
+                    self._sources[name] = source
+                    changed.append(name)
+        return changed
+
+    def _update(self, name, data):
+        data = _layer_data(name, data)
+        old_data = self._layers[name]
+        keys = set()
+        for key in set(old_data).union(data):
+            old_value = old_data.get(key, _MISSING)
+            value = data.get(key, _MISSING)
+            if old_value is not value and old_value != value:
+                keys.add(key)
+        self._layers[name] = data
+        self._recompute(keys)
+        return keys
+
+    def _recompute(self, keys):
+        if not keys:
+            return
+        merged = dict(self._data)
+        for key in keys:
+            value = _merge_layers([self._layers[name].get(key, _MISSING)
+                                   for name in self._names])
+            if value is _MISSING:
+                merged.pop(key, None)
+            else:
+                merged[key] = value
+        self._data = merged
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+_INOTIFY_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO |
+                 IN_CREATE | IN_DELETE)
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def _inotify_libc():
+    """ Return the libc with inotify functions or None if inotify isn't
+    available in this platform.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class ConfigReloader(object):
+    """ Watches config files and parses them again in a background thread
+    when they change.
+
+    On linux files are watched with inotify, on other platforms, or if
+    inotify isn't available, the files are stat polled. Bursts of writes to a
+    file are debounced, the file is parsed only after no change happened
+    during the debounce time.
+
+    The parsed structures are swapped atomically, so readers never block
+    waiting for a parse. A file failing to parse keeps its previous structure.
+    Subscribers are called from the reloader thread with the path and the new
+    structure.
+
+    Example:
+    >>> reloader = ConfigReloader(["conf/app.yml"])
+    >>> reloader.subscribe(lambda path, data: print("%s reloaded" % path))
+    >>> reloader.start()
+    >>> reloader.get("conf/app.yml")
+    >>> reloader.stop()
+    """
+
+    def __init__(self, paths, debounce=0.1, interval=1.0, loader=None,
+                 use_inotify=True):
+        """
+        :param list paths: Paths of the files to be watched.
+        :param float debounce: Seconds without changes to wait before
+        parsing a changed file.
+        :param float interval: Seconds between polls when stat polling.
+        :param callable loader: Function used to parse a path. Default is
+        load_yaml_file.
+        :param bool use_inotify: If inotify should be used when available.
+        """
+        self._paths = [os.path.abspath(path) for path in paths]
+        self._debounce = debounce
+        self._interval = interval
+        self._loader = load_yaml_file if loader is None else loader
+        self._libc = _inotify_libc() if use_inotify else None
+        self._data = {}
+        self._signatures = {}
+        self._polled = {}
+        self._pending = {}
+        self._subscribers = []
+        self._thread = None
+        self._stopping = threading.Event()
+        self._inotify_fd = None
+        self._watches = {}
+        self._wake_fds = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def __getitem__(self, path):
+        return self._data[os.path.abspath(path)]
+
+    @property
+    def backend(self):
+        """ Return the backend used to watch files.
+
+        :return str: Either "inotify" or "polling".
+        """
+        return "polling" if self._libc is None else "inotify"
+
+    @property
+    def data(self):
+        """ Return the parsed structures indexed by absolute path. """
+        return self._data
+
+    def get(self, path, default=None):
+        return self._data.get(os.path.abspath(path), default)
+
+    def subscribe(self, callback):
+        """ Add a callback to be called with the path and the new structure
+        every time a file is parsed again.
+
+        :param callable callback: The subscriber callback.
+        :return callable: The callback.
+        """
+        self._subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def start(self):
+        """ Parse the watched files and start watching them in a background
+        thread.
+        """
+        if self._thread is not None:
+            return
+        for path in self._paths:
+            self._load(path, notify=False)
+        if self._libc is not None:
+            self._start_inotify()
+        self._wake_fds = os.pipe()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name="cartola-config-reloader",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stop watching the files. """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        os.write(self._wake_fds[1], b"x")
+        self._thread.join()
+        self._thread = None
+        for fd in self._wake_fds:
+            os.close(fd)
+        self._wake_fds = None
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+            self._watches = {}
+
+    def _start_inotify(self):
+        fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            logger.warning("Unable to initialize inotify, falling back to "
+                           "stat polling: %s",
+                           os.strerror(ctypes.get_errno()))
+            self._libc = None
+            return
+        for directory in set(os.path.dirname(path) for path in self._paths):
+            wd = self._libc.inotify_add_watch(
+                fd, os.fsencode(directory), _INOTIFY_MASK)
+            if wd < 0:
+                logger.warning("Unable to watch %s with inotify, falling "
+                               "back to stat polling: %s", directory,
+                               os.strerror(ctypes.get_errno()))
+                os.close(fd)
+                self._libc = None
+                return
+            self._watches[wd] = directory
+        self._inotify_fd = fd
+
+    def _run(self):
+        next_poll = time.monotonic() + self._interval
+        while not self._stopping.is_set():
+            now = time.monotonic()
+            timeout = None if self._inotify_fd is not None else max(
+                0, next_poll - now)
+            if self._pending:
+                due = max(0, min(self._pending.values()) - now)
+                timeout = due if timeout is None else min(timeout, due)
+            fds = [self._wake_fds[0]]
+            if self._inotify_fd is not None:
+                fds.append(self._inotify_fd)
+            ready, _, _ = select.select(fds, [], [], timeout)
+            if self._stopping.is_set():
+                break
+            if self._inotify_fd is not None:
+                if self._inotify_fd in ready:
+                    self._read_events()
+            elif time.monotonic() >= next_poll:
+                self._poll()
+                next_poll = time.monotonic() + self._interval
+            now = time.monotonic()
+            for path, deadline in list(self._pending.items()):
+                if deadline <= now:
+                    del self._pending[path]
+                    self._load(path)
+
+    def _touch(self, path):
+        self._pending[path] = time.monotonic() + self._debounce
+
+    def _read_events(self):
+        try:
+            buffer = os.read(self._inotify_fd, 65536)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, length = _INOTIFY_EVENT.unpack_from(buffer, offset)
+            # The event name is skipped, all paths in the directory are
+            # touched
+            offset += _INOTIFY_EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                for path in self._paths:
+                    self._touch(path)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            # Any event in the directory touches all its watched paths, so
+            # symlink swapped files, like kubernetes config map mounts where
+            # ..data is renamed, are reloaded. Unchanged files are skipped
+            # by _load comparing the stat signature.
+            for path in self._paths:
+                if os.path.dirname(path) == directory:
+                    self._touch(path)
+
+    def _poll(self):
+        for path in self._paths:
+            try:
+                signature = _stat_signature(path)
+            except OSError:
+                signature = None
+            # Only a new change restarts the debounce time
+            if signature != self._polled.get(path, self._signatures.get(
+                    path)):
+                self._touch(path)
+            self._polled[path] = signature
+
+    def _load(self, path, notify=True):
+        try:
+            signature = _stat_signature(path)
+        except OSError as error:
+            logger.warning("Unable to reload %s: %s", path, error)
+            self._signatures[path] = None
+            return
+        if path in self._data and signature == self._signatures.get(path):
+            return
+        self._signatures[path] = signature
+        try:
+            data = self._loader(path)
+        except Exception:
+            logger.exception("Unable to parse %s, keeping the previous "
+                             "structure.", path)
+            return
+        new_data = dict(self._data)
+        new_data[path] = data
+        self._data = new_data
+        if not notify:
+            return
+        for callback in list(self._subscribers):
+            try:
+                callback(path, data)
+            except Exception:
+                logger.exception("Error notifying the %s reload.", path)
+
+
+# Resolved references are cached by (module, attr_name) tuples and by full
+# reference strings. Missing attributes are cached as _MISSING.
+_reference_cache = {}
+_reference_cache_enabled = True
+
+
+def set_reference_cache(enabled):
+    """ Enable or disable the cache used by get_from_module, get_from_string
+    and get_from_dict. Disabling the cache will also clear it.
+
+    :param bool enabled: If the reference cache should be used.
+    """
+    global _reference_cache_enabled
+    _reference_cache_enabled = enabled
+    if not enabled:
+        _reference_cache.clear()
+
+
+def clear_reference_cache(module=None):
+    """ Clear the references resolved from a module. If no module is informed
+    all cached references are cleared.
+
+    This must be called after a module is reloaded or an attribute, cached as
+    missing, is added to a module.
+
+    :param str module: The module name.
+    """
+    if module is None:
+        _reference_cache.clear()
+        return
+    for key in list(_reference_cache):
+        key_module = key[0] if isinstance(key, tuple) else key.rpartition(
+            ".")[0]
+        if key_module == module:
+            _reference_cache.pop(key, None)
+
+
+def _resolve_reference(key, module, attr_name, cache):
+    if cache and _reference_cache_enabled:
+        value = _reference_cache.get(key, _NOT_CACHED)
+        if value is not _NOT_CACHED:
+            return None if value is _MISSING else value
+    value = getattr(importlib.import_module(module), attr_name, _MISSING)
+    if cache and _reference_cache_enabled:
+        _reference_cache[key] = value
+    return None if value is _MISSING else value
+
+
+def get_from_module(module, attr_name, cache=True):
     """ Return a reference from a module.
     The attribute name must exist in the module, it could be a variable,
     a callable or a class.
 
     If reference name doesn't exists in the module it will return None.
 
+    Resolved references are cached, including missing ones, see
+    clear_reference_cache and set_reference_cache.
+
     Example:
     >>> get_from_module("my.module", "my_object")
     >>> get_from_module("my.module", "my_function")
@@ -45,16 +856,13 @@ def get_from_module(module, attr_name):
 
     :param basestring module: The module name.
     :param basestring attr_name: What should be returned from the module.
+    :param bool cache: If the reference cache should be used.
     :return: The value resolved by the module and attr name provided or None.
     """
-    module = importlib.import_module(module)
-    try:
-        return getattr(module, attr_name)
-    except AttributeError:
-        return None
+    return _resolve_reference((module, attr_name), module, attr_name, cache)
 
 
-def get_from_string(full_reference):
+def get_from_string(full_reference, cache=True):
     """ Return a reference from a string provided as a parameter.
     The reference name must be resolved as a module and some attribute from
     this module, it could be a variable, a callable or a class.
@@ -65,12 +873,16 @@ def get_from_string(full_reference):
     >>> get_from_string("my.module.Myclass")
 
     :param basestring full_reference: Absolute reference.
+    :param bool cache: If the reference cache should be used.
     :return: The reference resolved from the .
     """
-    module = ".".join(full_reference.split(".")[:-1])
-    attr_name = full_reference.split(".")[-1]
+    if cache and _reference_cache_enabled:
+        value = _reference_cache.get(full_reference, _NOT_CACHED)
+        if value is not _NOT_CACHED:
+            return None if value is _MISSING else value
+    module, _, attr_name = full_reference.rpartition(".")
     if module.strip() != "":
-        return get_from_module(module, attr_name)
+        return _resolve_reference(full_reference, module, attr_name, cache)
     return None
 
 
@@ -104,42 +916,274 @@ def get_from_dict(conf, **kwargs):
     indexes.
     :key str reference_index: The index for the full
     :key str attr_index: Index to be used to get the class name
+    :key bool cache: If the reference cache should be used. Default is True.
     :return: The class resolved at the module referred into the config.
     """
     reference_index = kwargs.get("reference_index", None)
     attr_index = kwargs.get("attr_index")
+    cache = kwargs.get("cache", True)
     if attr_index is None:
         if reference_index is None:
             reference_index = "reference"
-        return get_from_string(conf[reference_index])
+        return get_from_string(conf[reference_index], cache)
     # If attribute index is defined we're looking for module and attr by
     # default
     if reference_index is None:
         reference_index = "module"
-    return get_from_module(conf[reference_index], conf[attr_index])
+    return get_from_module(conf[reference_index], conf[attr_index], cache)
+
+
+BulkReferences = namedtuple("BulkReferences",
+                            ["results", "errors", "timings"])
+
+
+def _timed_import(module):
+    start = time.perf_counter()
+    error = None
+    try:
+        importlib.import_module(module)
+    except Exception as e:
+        error = e
+    return module, time.perf_counter() - start, error
+
+
+def get_from_strings(references, max_workers=None, cache=True):
+    """ Return many references from strings, importing their modules
+    concurrently.
+
+    Each module is imported once, no matter how many references point to it.
+    Modules are imported in a thread pool, python's per module import locks
+    keep the concurrent imports safe.
+
+    The references can be either a list of full references, returned indexed
+    by the full reference, or a dict with full references as values,
+    returned indexed by the dict keys.
+
+    Example:
+    >>> bulk = get_from_strings(["my.module.MyClass", "my.other.my_object"])
+    >>> bulk.results["my.module.MyClass"]
+    >>> bulk.errors
+    >>> sorted(bulk.timings.items(), key=lambda item: item[1])
+
+    :param references: List or dict of full references.
+    :param int max_workers: Maximum number of threads importing modules.
+    :param bool cache: If the reference cache should be used.
+    :return BulkReferences: The references resolved indexed in results,
+    errors raised importing the reference module indexed in errors and the
+    time in seconds taken to import each module in timings.
+    """
+    if hasattr(references, "items"):
+        items = list(references.items())
+    else:
+        items = [(reference, reference) for reference in references]
+    parsed = []
+    modules = []
+    for key, reference in items:
+        module, _, attr_name = reference.rpartition(".")
+        if module.strip() == "":
+            module = None
+        elif module not in modules:
+            modules.append(module)
+        parsed.append((key, module, attr_name))
+    timings = {}
+    module_errors = {}
+    if modules:
+        with ThreadPoolExecutor(max_workers=max_workers,
+                                thread_name_prefix="cartola-import") as pool:
+            for module, elapsed, error in pool.map(_timed_import, modules):
+                timings[module] = elapsed
+                if error is not None:
+                    module_errors[module] = error
+    results = {}
+    errors = {}
+    for key, module, attr_name in parsed:
+        if module is None:
+            results[key] = None
+        elif module in module_errors:
+            errors[key] = module_errors[module]
+        else:
+            results[key] = get_from_module(module, attr_name, cache)
+    return BulkReferences(results, errors, timings)
+
+
+class LazyReference(object):
+    """ A reference to an attribute from a module that will be imported only
+    when the reference is used for the first time.
+
+    Calling the lazy reference or accessing an attribute from it will resolve
+    the reference using get_from_module.
+
+    Example:
+    >>> handler_class = LazyReference("my.module", "MyHandler")
+    >>> handler_class.resolved
+    False
+    >>> handler = handler_class()
+    >>> handler_class.resolved
+    True
+    """
+
+    __slots__ = ("_module", "_attr_name", "_value", "_lock")
+
+    def __init__(self, module, attr_name):
+        """
+        :param str module: The module name.
+        :param str attr_name: What should be returned from the module.
+        """
+        self._module = module
+        self._attr_name = attr_name
+        self._value = _NOT_CACHED
+        self._lock = threading.Lock()
+
+    @property
+    def module(self):
+        return self._module
+
+    @property
+    def attr_name(self):
+        return self._attr_name
+
+    @property
+    def resolved(self):
+        """ Return True if the reference was already imported. """
+        return self._value is not _NOT_CACHED
+
+    def resolve(self):
+        """ Import the module and return the referenced attribute or None if
+        the attribute doesn't exist in the module.
+
+        :return: The value resolved by the module and attr name.
+        """
+        value = self._value
+        if value is _NOT_CACHED:
+            with self._lock:
+                if self._value is _NOT_CACHED:
+                    if self._module.strip() == "":
+                        self._value = None
+                    else:
+                        self._value = get_from_module(self._module,
+                                                      self._attr_name)
+                value = self._value
+        return value
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        # Slots not set yet, when copying for instance, must not resolve
+        if name in LazyReference.__slots__:
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
+
+    def __repr__(self):
+        return "<LazyReference %s.%s%s>" % (
+            self._module, self._attr_name,
+            "" if self.resolved else " (unresolved)")
+
+
+def lazy_from_string(full_reference):
+    """ Return a lazy reference from a string provided as a parameter. See
+    get_from_string.
+
+    :param basestring full_reference: Absolute reference.
+    :return LazyReference: The lazy reference.
+    """
+    module, _, attr_name = full_reference.rpartition(".")
+    return LazyReference(module, attr_name)
+
+
+def lazy_from_dict(conf, **kwargs):
+    """ Return a lazy reference from a configuration dict bit. The dict
+    indexes are handled as in get_from_dict.
+
+    :param dict conf: Configuration dict contained reference or/and attribute
+    indexes.
+    :key str reference_index: The index for the full
+    :key str attr_index: Index to be used to get the class name
+    :return LazyReference: The lazy reference.
+    """
+    reference_index = kwargs.get("reference_index", None)
+    attr_index = kwargs.get("attr_index")
+    if attr_index is None:
+        if reference_index is None:
+            reference_index = "reference"
+        return lazy_from_string(conf[reference_index])
+    if reference_index is None:
+        reference_index = "module"
+    return LazyReference(conf[reference_index], conf[attr_index])
+
+
+def warm_up_references(references, max_workers=None):
+    """ Resolve lazy references in background threads, so modules can be
+    imported after the service is already accepting traffic.
+
+    The call returns right away. Import errors are kept in the returned
+    futures and will be raised again when the reference is used.
+
+    :param references: Iterable of LazyReference.
+    :param int max_workers: Maximum number of threads importing references.
+    :return list: The futures resolving each reference.
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers,
+                                  thread_name_prefix="cartola-warm-up")
+    futures = [executor.submit(reference.resolve)
+               for reference in references]
+    executor.shutdown(wait=False)
+    return futures
+
+
+def _cache_log_level(name, level):
+    _log_levels[name] = level
+    _log_levels[str(level)] = level
+    _log_levels[level] = level
+
+
+# Log levels indexed by name, numeric string and number. Custom levels
+# registered with logging.addLevelName are added on their first lookup.
+_log_levels = {}
+for _name, _level in (logging.getLevelNamesMapping().items()
+                      if hasattr(logging, "getLevelNamesMapping") else
+                      logging._nameToLevel.items()):
+    _cache_log_level(_name, _level)
+del _name, _level
+
+
+def _resolve_log_level(str_level):
+    if isinstance(str_level, str):
+        name = str_level.strip().upper()
+        level = _log_levels.get(name)
+        if level is None:
+            if name.isdigit():
+                level = _resolve_log_level(int(name))
+                if level == logging.NOTSET:
+                    return level
+            else:
+                # Returns the level number only for registered level names
+                level = logging.getLevelName(name)
+                if not isinstance(level, int):
+                    return logging.NOTSET
+                _cache_log_level(name, level)
+        _log_levels[str_level] = level
+        return level
+    if isinstance(str_level, int) and not isinstance(str_level, bool):
+        name = logging.getLevelName(str_level)
+        if name.startswith("Level "):
+            return logging.NOTSET
+        _cache_log_level(name, str_level)
+        return str_level
+    return logging.NOTSET
 
 
 def log_level_from_string(str_level):
     """ Return the log level defined in the logging module by a sting.
 
+    Level names are case insensitive, numeric strings and numbers are also
+    accepted. Custom levels registered with logging.addLevelName are
+    resolved as well. Unknown levels return logging.NOTSET.
+
     :param str_level: Log level string
     :return: The log level code
     """
-    levels = {
-        'CRITICAL': logging.CRITICAL,
-        'ERROR': logging.ERROR,
-        'WARNING': logging.WARNING,
-        'WARN': logging.WARNING,
-        'INFO': logging.INFO,
-        'DEBUG': logging.DEBUG,
-        'NOTSET': logging.NOTSET,
-    }
     try:
-        return levels[str_level.upper()]
-    except KeyError:
-        pass
-    except AttributeError:
-        if str_level in [logging.DEBUG, logging.INFO, logging.WARNING,
-                         logging.ERROR, logging.CRITICAL]:
-            return str_level
-    return logging.NOTSET
+        return _log_levels[str_level]
+    except (KeyError, TypeError):
+        return _resolve_log_level(str_level)
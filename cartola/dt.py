@@ -15,25 +15,272 @@
 # limitations under the License.
 
 import calendar
-from datetime import datetime
+from collections import namedtuple
+from datetime import (date, datetime, MAXYEAR, MINYEAR, timedelta, timezone,
+                      tzinfo)
+import functools
+import re
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
+
+# Directives the mask compiler handles, with the datetime argument position
+# and the regex matching the directive value.
+_MASK_DIRECTIVES = {
+    "Y": (0, r"(\d{4})"),
+    "m": (1, r"(\d{2})"),
+    "d": (2, r"(\d{2})"),
+    "H": (3, r"(\d{2})"),
+    "M": (4, r"(\d{2})"),
+    "S": (5, r"(\d{2})"),
+    "f": (6, r"(\d{1,6})"),
+}
+# Default datetime arguments, the same used by strptime
+_MASK_DEFAULTS = (1900, 1, 1, 0, 0, 0, 0)
+# Masks matching only strings datetime.fromisoformat parses. Before python
+# 3.11 fromisoformat accepts only 3 or 6 digits as fraction of seconds.
+_ISO_MASKS = frozenset(["%Y-%m-%d"] + [
+    "%Y-%m-%d{}%H:%M:%S{}".format(separator, fraction)
+    for separator in ("T", " ")
+    for fraction in (("", ".%f") if sys.version_info >= (3, 11) else ("",))
+])
+
+
+def _strptime_parser(mask):
+    strptime = datetime.strptime
+
+    def parse(value):
+        return strptime(value, mask)
+    return parse
+
+
+@functools.lru_cache(maxsize=128)
+def compile_mask(mask):
+    """ Return a function parsing strings into date times using a giving
+    mask.
+
+    Masks containing only the %Y, %m, %d, %H, %M, %S, %f and %% directives
+    are compiled into a regex based parser. The %Y-%m-%d, %Y-%m-%d %H:%M:%S
+    and ISO-8601 variants are parsed by datetime.fromisoformat after the
+    value is validated by the regex. Values not matching the regex, like
+    months without the zero padding, and other masks are parsed by
+    datetime.strptime, so the result is always the same strptime returns.
+
+    Compiled masks are cached.
+
+    :param str mask:
+    :return: A function parsing a string into a datetime
+    :rtype: callable
+    """
+    pattern = []
+    positions = []
+    index = 0
+    while index < len(mask):
+        char = mask[index]
+        if char != "%":
+            pattern.append(re.escape(char))
+            index += 1
+            continue
+        directive = mask[index + 1:index + 2]
+        index += 2
+        if directive == "%":
+            pattern.append("%")
+            continue
+        if directive not in _MASK_DIRECTIVES:
+            return _strptime_parser(mask)
+        position, regex = _MASK_DIRECTIVES[directive]
+        if position in positions:
+            return _strptime_parser(mask)
+        positions.append(position)
+        pattern.append(regex)
+    if not positions:
+        return _strptime_parser(mask)
+    match = re.compile("".join(pattern), re.ASCII).fullmatch
+    strptime = datetime.strptime
+    if mask in _ISO_MASKS:
+        fromisoformat = datetime.fromisoformat
+
+        def parse_iso(value):
+            if match(value) is not None:
+                try:
+                    return fromisoformat(value)
+                except ValueError:
+                    pass
+            return strptime(value, mask)
+        return parse_iso
+    microsecond = 6 in positions
+    if len(positions) > 2 and positions == list(range(len(positions))):
+        # Directives in the datetime arguments order, like the ISO masks
+        if microsecond:
+            def build(groups):
+                return datetime(*map(int, groups[:-1]),
+                                int(groups[-1].ljust(6, "0")))
+        else:
+            def build(groups):
+                return datetime(*map(int, groups))
+    else:
+        def build(groups):
+            arguments = list(_MASK_DEFAULTS)
+            for position, group in zip(positions, groups):
+                arguments[position] = int(group.ljust(6, "0")
+                                          if position == 6 else group)
+            return datetime(*arguments)
+
+    def parse(value):
+        matched = match(value)
+        if matched is not None:
+            try:
+                return build(matched.groups())
+            except ValueError:
+                pass
+        # Let strptime parse or raise the proper error
+        return strptime(value, mask)
+    return parse
 
 
 def extract_datetime(dictionary, key, mask):
     """ Extract a date time from a dictionary by it's key and if the value
     isn't a datetime will convert using a giving mask.
 
+    The mask is compiled by compile_mask.
+
     :param dict dictionary:
     :param str|int key:
     :param str mask:
     :return: The date time from a dict by it's key
     :rtype: datetime
     """
-    if dictionary.get(key) is None:
+    value = dictionary.get(key)
+    if value is None or isinstance(value, datetime):
+        return value
+    return compile_mask(mask)(value)
+
+
+def parse_datetimes(values, mask, as_array=False):
+    """ Parse a column of strings into date times using a giving mask.
+    Values that are already date times are kept and None values are returned
+    as None.
+
+    If as_array is True and NumPy is available a datetime64 array is returned
+    with None values as NaT. Without NumPy a list is returned.
+
+    :param values: Iterable of strings, date times or None.
+    :param str mask:
+    :param bool as_array: If a NumPy datetime64 array should be returned.
+    :return: The date times parsed
+    :rtype: list|numpy.ndarray
+    """
+    parse = compile_mask(mask)
+    result = [value if value is None or isinstance(value, datetime) else
+              parse(value) for value in values]
+    if as_array and numpy is not None:
+        return numpy.array(result, dtype="datetime64[us]")
+    return result
+
+
+def extract_datetimes(dictionaries, key, mask, as_array=False):
+    """ Extract date times from many dictionaries by a key, converting values
+    that aren't date times using a giving mask. See parse_datetimes.
+
+    :param dictionaries: Iterable of dicts.
+    :param str|int key:
+    :param str mask:
+    :param bool as_array: If a NumPy datetime64 array should be returned.
+    :return: The date times from each dict by it's key
+    :rtype: list|numpy.ndarray
+    """
+    return parse_datetimes((dictionary.get(key)
+                            for dictionary in dictionaries), mask, as_array)
+
+
+@functools.lru_cache(maxsize=256)
+def get_timezone(name):
+    """ Return the tzinfo of a time zone by it's name. Resolved time zones are
+    cached.
+
+    UTC is always available, other time zones are resolved by zoneinfo, that
+    requires python 3.9 or newer.
+
+    :param str name: The time zone name, like America/Sao_Paulo
+    :return: The time zone
+    :rtype: tzinfo
+    """
+    if name.upper() == "UTC":
+        return timezone.utc
+    if ZoneInfo is None:
+        raise ValueError("Unable to resolve the time zone %s, zoneinfo "
+                         "requires python 3.9 or newer." % name)
+    return ZoneInfo(name)
+
+
+def _resolve_timezone(tz):
+    return tz if isinstance(tz, tzinfo) else get_timezone(tz)
+
+
+def extract_datetime_tz(dictionary, key, mask, tz):
+    """ Extract a time zone aware date time from a dictionary by it's key. See
+    extract_datetime.
+
+    Naive date times are considered to be in the giving time zone, aware
+    date times are converted to the giving time zone.
+
+    :param dict dictionary:
+    :param str|int key:
+    :param str mask:
+    :param str|tzinfo tz: The time zone name or tzinfo.
+    :return: The time zone aware date time from a dict by it's key
+    :rtype: datetime
+    """
+    value = extract_datetime(dictionary, key, mask)
+    if value is None:
         return None
-    if isinstance(dictionary.get(key), datetime):
-        return dictionary.get(key)
-    else:
-        return datetime.strptime(dictionary.get(key), mask)
+    tz = _resolve_timezone(tz)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=tz)
+    return value.astimezone(tz)
+
+
+def extract_datetimes_utc(dictionaries, key, mask, tz):
+    """ Extract date times from many dictionaries by a key converting them to
+    UTC in one pass. Naive date times are considered to be in the giving time
+    zone. None values are returned as None.
+
+    :param dictionaries: Iterable of dicts.
+    :param str|int key:
+    :param str mask:
+    :param str|tzinfo tz: The time zone name or tzinfo.
+    :return: The UTC date times from each dict by it's key
+    :rtype: list
+    """
+    tz = _resolve_timezone(tz)
+    parse = compile_mask(mask)
+    utc = timezone.utc
+    result = []
+    for dictionary in dictionaries:
+        value = dictionary.get(key)
+        if value is None:
+            result.append(None)
+            continue
+        if not isinstance(value, datetime):
+            value = parse(value)
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=tz)
+        result.append(value.astimezone(utc))
+    return result
+
+
+# Days in each month of a common year and the zero padded month numbers
+_MONTH_DAYS = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+_PADDED_MONTHS = tuple("%02d" % month for month in range(1, 13))
 
 
 def last_day_of_month(year, month):
@@ -44,7 +291,11 @@ def last_day_of_month(year, month):
     :return: The last day of month
     :rtype: int
     """
-    return calendar.monthrange(year, month)[1]
+    if not 1 <= month <= 12:
+        raise calendar.IllegalMonthError(month)
+    if month == 2 and calendar.isleap(year):
+        return 29
+    return _MONTH_DAYS[month - 1]
 
 
 def complete_month(year, month):
@@ -56,4 +307,122 @@ def complete_month(year, month):
     :return: Month number padded with zero.
     :rtype: str
     """
-    return datetime(year, month, 1).strftime("%m")
+    if not MINYEAR <= year <= MAXYEAR:
+        raise ValueError("year %d is out of range" % year)
+    if not 1 <= month <= 12:
+        raise ValueError("month must be in 1..12")
+    return _PADDED_MONTHS[month - 1]
+
+
+def iter_months(start, end):
+    """ Yields the year and month of each month from the start date month to
+    the end date month, both included.
+
+    :param date start:
+    :param date end:
+    :return: Tuples with year and month
+    :rtype: tuple
+    """
+    for index in range(start.year * 12 + start.month - 1,
+                       end.year * 12 + end.month):
+        year, month = divmod(index, 12)
+        yield year, month + 1
+
+
+def iter_days(start, end):
+    """ Yields the year, month and day of each day from the start date to the
+    end date, both included.
+
+    :param date start:
+    :param date end:
+    :return: Tuples with year, month and day
+    :rtype: tuple
+    """
+    first_month = (start.year, start.month)
+    last_month = (end.year, end.month)
+    for year, month in iter_months(start, end):
+        first_day = start.day if (year, month) == first_month else 1
+        last_day = (end.day if (year, month) == last_month else
+                    last_day_of_month(year, month))
+        for day in range(first_day, last_day + 1):
+            yield year, month, day
+
+
+Bucket = namedtuple("Bucket", ["start", "end", "value"])
+BUCKET_PERIODS = ("day", "week", "month")
+
+
+def _bucket_bounds(value, period):
+    if period == "day":
+        start = date(value.year, value.month, value.day)
+        return start, start
+    if period == "week":
+        start = date(value.year, value.month, value.day) - timedelta(
+            days=value.weekday())
+        return start, start + timedelta(days=6)
+    return (date(value.year, value.month, 1),
+            date(value.year, value.month,
+                 last_day_of_month(value.year, value.month)))
+
+
+def _count(value, _):
+    return value + 1
+
+
+def bucket_datetimes(records, key, mask, period="day", reducer=None,
+                     initial=int, max_open=1):
+    """ Group a stream of records in day, week or month buckets by a date time
+    extracted from each record, yielding the aggregated value of a bucket as
+    soon as it is closed.
+
+    Only max_open buckets are kept in memory. When a record falls in a new
+    bucket and max_open buckets are open, the oldest bucket is closed and
+    yielded. With the default max_open, records must be sorted by date time,
+    increase it to tolerate records out of order. A record arriving after its
+    bucket was closed opens a new bucket for the same period.
+
+    Weeks start on monday. Records without the date time are skipped.
+
+    Example:
+    >>> records = iter_records_sorted_by_date()
+    >>> for bucket in bucket_datetimes(records, "created", "%Y-%m-%d",
+    >>>                                period="month"):
+    >>>     print(bucket.start, bucket.end, bucket.value)
+
+    Summing a record value:
+    >>> bucket_datetimes(records, "created", "%Y-%m-%d",
+    >>>                  reducer=lambda total, record: total + record['value'])
+
+    :param records: Iterable of dicts.
+    :param str|int key: The record key with the date time.
+    :param str mask: Mask used to convert the date time. See extract_datetime.
+    :param str period: Either "day", "week" or "month".
+    :param callable reducer: Function receiving the bucket value and a record
+    returning the new bucket value. Default counts the records.
+    :param callable initial: Function returning the initial bucket value.
+    :param int max_open: Maximum number of buckets kept open.
+    :return: Buckets with the start and end dates and the aggregated value
+    :rtype: Bucket
+    """
+    if period not in BUCKET_PERIODS:
+        raise ValueError("period must be one of %s" % ", ".join(
+            BUCKET_PERIODS))
+    if max_open < 1:
+        raise ValueError("max_open must be at least 1")
+    if reducer is None:
+        reducer = _count
+    buckets = {}
+    for record in records:
+        value = extract_datetime(record, key, mask)
+        if value is None:
+            continue
+        start, end = _bucket_bounds(value, period)
+        bucket = buckets.get(start)
+        if bucket is None:
+            if len(buckets) >= max_open:
+                oldest = min(buckets)
+                yield Bucket(oldest, *buckets.pop(oldest))
+            bucket = buckets[start] = [end, initial()]
+        bucket[1] = reducer(bucket[1], record)
+    for start in sorted(buckets):
+        yield Bucket(start, *buckets[start])
@@ -14,43 +14,267 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import OrderedDict
+import functools
+import linecache
+import logging
 import sys
+import threading
+import time
+import traceback
+import types
+
+_EMPTY_MAPPING = types.MappingProxyType({})
 
 
 class FauxTb(object):
-    def __init__(self, tb_frame, tb_lineno, tb_next):
+    """ Traceback entry used to extend a traceback with the frames from the
+    current stack. A tb_lasti of -1 means the instruction is unknown, only
+    the line number is used to locate the code.
+    """
+
+    __slots__ = ("tb_frame", "tb_lineno", "tb_next", "tb_lasti")
+
+    def __init__(self, tb_frame, tb_lineno, tb_next, tb_lasti=-1):
         self.tb_frame = tb_frame
         self.tb_lineno = tb_lineno
         self.tb_next = tb_next
+        self.tb_lasti = tb_lasti
+
+
+class FauxCode(object):
+    """ Snapshot of the code object attributes used to format tracebacks. """
+
+    __slots__ = ("co_filename", "co_name", "co_qualname", "co_firstlineno")
 
+    def __init__(self, code):
+        self.co_filename = code.co_filename
+        self.co_name = code.co_name
+        self.co_qualname = getattr(code, "co_qualname", code.co_name)
+        self.co_firstlineno = code.co_firstlineno
+
+    def _key(self):
+        return self.co_filename, self.co_firstlineno, self.co_name
+
+    def __eq__(self, other):
+        if not isinstance(other, FauxCode):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        return hash(self._key())
+
+
+class FauxFrame(object):
+    """ Snapshot of a frame keeping only the file name, line number and
+    function name, so it doesn't retain the frame locals and globals.
+    """
 
-def current_stack(skip=0):
+    __slots__ = ("f_code", "f_lineno", "f_globals", "f_locals", "f_back")
+
+    def __init__(self, code, lineno):
+        self.f_code = FauxCode(code)
+        self.f_lineno = lineno
+        self.f_globals = _EMPTY_MAPPING
+        self.f_locals = _EMPTY_MAPPING
+        self.f_back = None
+
+
+if hasattr(sys, "_getframe"):
+    _getframe = sys._getframe
+else:
+    def _getframe(depth=0):
+        """ Fallback for python implementations without sys._getframe. """
+        try:
+            1/0
+        except ZeroDivisionError:
+            f = sys.exc_info()[2].tb_frame.f_back
+        for i in range(depth):
+            if f is None:
+                break
+            f = f.f_back
+        if f is None:
+            raise ValueError("call stack is not deep enough")
+        return f
+
+
+def _walk_stack(f, max_depth=None):
+    depth = 0
+    while f is not None and (max_depth is None or depth < max_depth):
+        yield f, f.f_lineno
+        f = f.f_back
+        depth += 1
+
+
+def current_stack(skip=0, max_depth=None, lazy=False):
+    """ Return the frames and line numbers of the current stack, starting
+    from the caller of the function calling current_stack.
+
+    When lazy is True an iterator walking the stack on demand is returned
+    instead of a list, it must be consumed before the calling function
+    returns.
+
+    :param int skip: Number of frames to skip.
+    :param int max_depth: Maximum number of frames returned.
+    :param bool lazy: If an iterator should be returned instead of a list.
+    :return list|iterator: Tuples with the frame and line number
+    """
     try:
-        1/0
-    except ZeroDivisionError:
-        f = sys.exc_info()[2].tb_frame
-    # On python 3 range works as xrange in python 2
-    # See: https://stackoverflow.com/a/15014361/2887989
-    for i in range(skip + 2):
+        f = _getframe(skip + 2)
+    except ValueError:
+        f = None
+    if lazy:
+        return _walk_stack(f, max_depth)
+    stack = []
+    while f is not None and (max_depth is None or len(stack) < max_depth):
+        stack.append((f, f.f_lineno))
         f = f.f_back
-    lst = []
-    while f is not None:
-        lst.append((f, f.f_lineno))
+    return stack
+
+
+def _awaiting_frames(awaitable):
+    """ Return the frames of an await chain, from the innermost to the
+    outermost awaitable.
+    """
+    frames = []
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None)
+        if frame is not None:
+            awaitable = awaitable.cr_await
+        else:
+            frame = getattr(awaitable, "gi_frame", None)
+            if frame is None:
+                break
+            awaitable = awaitable.gi_yieldfrom
+        frames.append(frame)
+    frames.reverse()
+    return frames
+
+
+def _task_coro(task):
+    """ Return the task coroutine, Task.get_coro was added in python 3.8. """
+    get_coro = getattr(task, "get_coro", None)
+    if get_coro is None:
+        return getattr(task, "_coro", None)
+    return get_coro()
+
+
+def _awaiting_task(asyncio, task):
+    """ Return the first task waiting for the given task, if any.
+
+    This depends on the private Task._callbacks list and the bound wakeup
+    method of the waiting task being registered there. When either is
+    missing, no task is returned and the await chain isn't stitched.
+    """
+    for callback, _ in getattr(task, "_callbacks", None) or ():
+        owner = getattr(callback, "__self__", None)
+        if isinstance(owner, asyncio.Task):
+            return owner
+    return None
+
+
+def current_async_stack(skip=0, max_depth=None):
+    """ Return the frames and line numbers of the current stack like
+    current_stack, but when called from an asyncio task the event loop
+    frames are replaced by the await chain of the tasks waiting for it.
+
+    The stack is walked up to the root coroutine frame of the current task.
+    Then for each task waiting on it, the first one found in the task
+    callbacks, the frames of its await chain are added from the innermost to
+    the outermost one. Outside of a task this is the same as current_stack.
+
+    :param int skip: Number of frames to skip.
+    :param int max_depth: Maximum number of frames returned.
+    :return list: Tuples with the frame and line number
+    """
+    # No task can be running if asyncio was never imported
+    asyncio = sys.modules.get("asyncio")
+    task = None
+    if asyncio is not None:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            pass
+    if task is None:
+        return current_stack(skip + 1, max_depth)
+    root = _task_coro(task)
+    root_frame = getattr(root, "cr_frame", getattr(root, "gi_frame", None))
+    # Starting from the function calling current_async_stack as it could be
+    # the root coroutine already
+    try:
+        f = _getframe(skip + 1)
+    except ValueError:
+        f = None
+    stack = []
+    while f is not None and f is not root_frame:
         f = f.f_back
-    return lst
+        if f is None or (max_depth is not None and len(stack) >= max_depth):
+            break
+        stack.append((f, f.f_lineno))
+    seen = {task}
+    task = _awaiting_task(asyncio, task)
+    while task is not None and task not in seen:
+        for frame in _awaiting_frames(_task_coro(task)):
+            if max_depth is not None and len(stack) >= max_depth:
+                return stack
+            stack.append((frame, frame.f_lineno))
+        seen.add(task)
+        task = _awaiting_task(asyncio, task)
+    return stack
 
 
-def extend_traceback(tb, stack):
-    """Extend traceback with stack info."""
+def detach_traceback(tb):
+    """ Return a copy of a traceback with FauxFrame snapshots instead of the
+    frames, so the copy doesn't retain the frames locals.
+
+    :param tb: The traceback.
+    :return FauxTb: The detached traceback
+    """
+    entries = []
+    while tb is not None:
+        entries.append((tb.tb_frame.f_code, tb.tb_lineno))
+        tb = tb.tb_next
+    head = None
+    for code, lineno in reversed(entries):
+        head = FauxTb(FauxFrame(code, lineno), lineno, head)
+    return head
+
+
+def extend_traceback(tb, stack, detached=False):
+    """Extend traceback with stack info.
+
+    When detached is True the whole traceback is built with FauxFrame
+    snapshots holding only file name, line number and function name. See
+    detach_traceback.
+
+    :param tb: The traceback.
+    :param stack: The frames and line numbers returned by current_stack.
+    :param bool detached: If the frames should be replaced by snapshots.
+    :return: The extended traceback
+    """
+    if detached:
+        head = detach_traceback(tb)
+        for tb_frame, tb_lineno in stack:
+            head = FauxTb(FauxFrame(tb_frame.f_code, tb_lineno), tb_lineno,
+                          head)
+        return head
     head = tb
     for tb_frame, tb_lineno in stack:
-        head = FauxTb(tb_frame, tb_lineno, head)
+        head = FauxTb(tb_frame, tb_lineno, head, tb_frame.f_lasti)
     return head
 
 
-def full_exc_info():
+def full_exc_info(detached=False):
     """Like sys.exc_info, but includes the full traceback.
 
+    When detached is True the traceback returned doesn't retain the frames,
+    see extend_traceback. The exception value still references its own
+    traceback.
+
     See: https://stackoverflow.com/a/13210518/2887989
 
     Example:
@@ -69,7 +293,307 @@ def full_exc_info():
     >>>
     >>> func2()
     >>>
+
+    :param bool detached: If the frames should be replaced by snapshots.
+    :return: The exception type, value and full traceback
+    """
+    t, v, tb = sys.exc_info()
+    full_tb = extend_traceback(tb, current_stack(1, lazy=True), detached)
+    return t, v, full_tb
+
+
+def _code_location(code, lineno):
+    """ Return a hashable location of a code and line number. Code objects
+    can't be used, their equality ignores the file name.
+    """
+    return code.co_filename, code.co_firstlineno, code.co_name, lineno
+
+
+def exc_fingerprint(exc_type, tb, stack=()):
+    """ Return a hashable fingerprint of an exception built from its type and
+    the location, file name, first line, name and line number, of every
+    traceback and stack entry code.
+
+    :param exc_type: The exception type.
+    :param tb: The exception traceback.
+    :param stack: The frames and line numbers returned by current_stack.
+    :return tuple: The exception fingerprint
+    """
+    locations = []
+    while tb is not None:
+        locations.append(_code_location(tb.tb_frame.f_code, tb.tb_lineno))
+        tb = tb.tb_next
+    for frame, lineno in stack:
+        locations.append(_code_location(frame.f_code, lineno))
+    return exc_type, tuple(locations)
+
+
+class DedupExceptionLogger(object):
+    """ Log exceptions with their full traceback only once per fingerprint,
+    see exc_fingerprint. Repeats are counted and a single record with the
+    count is emitted per time window, so a burst of the same error doesn't
+    format and log thousands of tracebacks.
+
+    Expired windows are logged when any exception is logged with the
+    instance. Call flush periodically, from a timer for instance, so the
+    count of a burst that just ended isn't held until the next exception.
+
+    Example:
+    >>> dedup = DedupExceptionLogger(logging.getLogger(__name__), window=60)
+    >>>
+    >>> def func():
+    >>>     try:
+    >>>         raise Exception('Dummy')
+    >>>     except Exception:
+    >>>         dedup.exception("Something awful happened!")
+    """
+
+    def __init__(self, logger=None, window=60.0, max_fingerprints=1024,
+                 detached=True, clock=None):
+        """ Create a deduplicating exception logger.
+
+        :param logging.Logger logger: The logger used, default is the module
+        logger.
+        :param float window: Seconds a repeat count is accumulated before
+        being logged.
+        :param int max_fingerprints: Maximum fingerprints tracked, the least
+        recently seen are flushed and forgotten first.
+        :param bool detached: If the logged traceback should be detached, see
+        extend_traceback.
+        :param callable clock: Function returning the current time in seconds.
+        """
+        self._logger = (logging.getLogger(__name__) if logger is None
+                        else logger)
+        self._window = window
+        self._max_fingerprints = max_fingerprints
+        self._detached = detached
+        self._clock = time.monotonic if clock is None else clock
+        # fingerprint -> [window start, repeats, level, msg, args]
+        self._entries = OrderedDict()
+        # When the oldest window with repeats expires
+        self._next_sweep = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def exception(self, msg, *args, **kwargs):
+        """ Log the exception being handled with level ERROR.
+
+        :param str msg: The log message.
+        :return bool: True if the full traceback was logged
+        """
+        return self._log(logging.ERROR, msg, args, kwargs)
+
+    def log(self, level, msg, *args, **kwargs):
+        """ Log the exception being handled with the given level.
+
+        :param int level: The log level.
+        :param str msg: The log message.
+        :return bool: True if the full traceback was logged
+        """
+        return self._log(level, msg, args, kwargs)
+
+    def _log(self, level, msg, args, kwargs):
+        # The records are built here, logging would find _log as the caller
+        caller = _getframe(1 + kwargs.pop("stacklevel", 1))
+        exc_type, value, tb = sys.exc_info()
+        if exc_type is None:
+            self._emit(caller, level, msg, args, **kwargs)
+            return False
+        # Skipping log/exception and the frame handling the exception, it is
+        # already the first traceback entry. Same as in full_exc_info.
+        stack = current_stack(2)
+        fingerprint = exc_fingerprint(exc_type, tb, stack)
+        now = self._clock()
+        summaries = []
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                self._entries[fingerprint] = [now, 0, level, msg, args]
+                while len(self._entries) > self._max_fingerprints:
+                    _, evicted = self._entries.popitem(last=False)
+                    if evicted[1]:
+                        summaries.append(evicted)
+            else:
+                self._entries.move_to_end(fingerprint)
+                if not entry[1] and now - entry[0] >= self._window:
+                    # First repeat after an idle window starts a new one
+                    entry[0] = now
+                entry[1] += 1
+                entry[2:] = level, msg, args
+                expires = entry[0] + self._window
+                if self._next_sweep is None or expires < self._next_sweep:
+                    self._next_sweep = expires
+            if self._next_sweep is not None and now >= self._next_sweep:
+                summaries.extend(self._sweep(now))
+        for summary in summaries:
+            self._log_repeats(caller, summary, now)
+        if entry is not None:
+            return False
+        kwargs["exc_info"] = (exc_type, value, extend_traceback(
+            tb, stack, self._detached))
+        self._emit(caller, level, msg, args, **kwargs)
+        return True
+
+    def _emit(self, caller, level, msg, args, exc_info=None, extra=None,
+              stack_info=False):
+        """ Log a record located at the caller frame, like Logger.log with
+        stacklevel, which isn't available before python 3.8.
+        """
+        if not self._logger.isEnabledFor(level):
+            return
+        sinfo = None
+        if stack_info:
+            sinfo = "Stack (most recent call last):\n%s" % "".join(
+                traceback.format_stack(caller)).rstrip("\n")
+        record = self._logger.makeRecord(
+            self._logger.name, level, caller.f_code.co_filename,
+            caller.f_lineno, msg, args, exc_info, caller.f_code.co_name,
+            extra, sinfo)
+        self._logger.handle(record)
+
+    def _sweep(self, now, force=False):
+        """ Return copies of the entries with repeats and an expired window,
+        or all entries with repeats if forced, starting new windows for them.
+        Must be called holding the lock.
+        """
+        expired = []
+        self._next_sweep = None
+        for entry in self._entries.values():
+            if not entry[1]:
+                continue
+            if force or now - entry[0] >= self._window:
+                expired.append(list(entry))
+                entry[0], entry[1] = now, 0
+            elif (self._next_sweep is None or
+                  entry[0] + self._window < self._next_sweep):
+                self._next_sweep = entry[0] + self._window
+        return expired
+
+    def _log_repeats(self, caller, entry, now):
+        started, repeats, level, msg, args = entry
+        # The suffix has no % characters, logging still formats the message
+        # with the args and handles formatting errors
+        self._emit(caller, level, "%s (repeated %d times in the last %.1f "
+                                  "seconds)" % (msg, repeats, now - started),
+                   args)
+
+    def flush(self):
+        """ Log the pending repeat counts and start new windows. """
+        self._flush(_getframe(1))
+
+    def _flush(self, caller):
+        now = self._clock()
+        with self._lock:
+            pending = self._sweep(now, True)
+        for entry in pending:
+            self._log_repeats(caller, entry, now)
+
+    def clear(self):
+        """ Flush the pending repeat counts and forget all fingerprints. """
+        self._flush(_getframe(1))
+        with self._lock:
+            self._entries.clear()
+
+
+@functools.lru_cache(maxsize=4096)
+def _render_frame(filename, firstlineno, name, lineno):
+    line = linecache.getline(filename, lineno).strip()
+    return filename, lineno, name, line or None
+
+
+def clear_line_cache():
+    """ Clear the rendered frames cache used by format_traceback_records and
+    the linecache, needed when source files change while running.
+    """
+    _render_frame.cache_clear()
+    linecache.clearcache()
+
+
+def _traceback_records(tb, max_frames=None, collapse_recursion=True):
+    records = []
+    last_key = None
+    while tb is not None:
+        key = _code_location(tb.tb_frame.f_code, tb.tb_lineno)
+        if collapse_recursion and key == last_key:
+            records[-1]["repeated"] += 1
+        else:
+            filename, lineno, name, line = _render_frame(*key)
+            records.append({"filename": filename, "lineno": lineno,
+                            "name": name, "line": line, "repeated": 0})
+            last_key = key
+        tb = tb.tb_next
+    omitted = 0
+    if max_frames is not None and len(records) > max_frames:
+        omitted = len(records) - max_frames
+        records = records[omitted:] if max_frames else []
+    return records, omitted
+
+
+def format_traceback_records(tb, max_frames=None, collapse_recursion=True):
+    """ Render a traceback, like the ones returned by full_exc_info, to a
+    list of JSON friendly frame records ordered from the outermost to the
+    innermost frame.
+
+    Each record has the filename, lineno, name and line (None when the
+    source isn't available) keys. The rendered frames are cached by code
+    location and line number, see clear_line_cache.
+
+    When collapse_recursion is True consecutive entries of the same code and
+    line number are rendered once and the record repeated key counts the
+    extra entries.
+
+    :param tb: The traceback.
+    :param int max_frames: Maximum number of records returned, the innermost
+    records are kept.
+    :param bool collapse_recursion: If recursive entries should be collapsed.
+    :return list: The frame records
+    """
+    return _traceback_records(tb, max_frames, collapse_recursion)[0]
+
+
+def format_exc_info_records(exc_info=None, max_frames=None,
+                            collapse_recursion=True):
+    """ Render an exception to a JSON friendly record with the type, message,
+    frames and omitted keys. See format_traceback_records.
+
+    When exc_info isn't informed the exception being handled is used with
+    its traceback extended by the current stack, like full_exc_info.
+
+    :param tuple exc_info: The exception type, value and traceback.
+    :param int max_frames: Maximum number of frame records, the innermost
+    records are kept and omitted counts the dropped ones.
+    :param bool collapse_recursion: If recursive entries should be collapsed.
+    :return dict: The exception record
+    """
+    if exc_info is None:
+        exc_type, value, tb = sys.exc_info()
+        tb = extend_traceback(tb, current_stack(1, lazy=True))
+    else:
+        exc_type, value, tb = exc_info
+    records, omitted = _traceback_records(tb, max_frames, collapse_recursion)
+    type_name = None
+    if exc_type is not None:
+        type_name = exc_type.__qualname__
+        if exc_type.__module__ not in ("builtins", "__main__"):
+            type_name = "%s.%s" % (exc_type.__module__, type_name)
+    return {
+        "type": type_name,
+        "message": None if value is None else str(value),
+        "frames": records,
+        "omitted": omitted,
+    }
+
+
+def full_async_exc_info(detached=False):
+    """Like full_exc_info, but when called from an asyncio task the
+    traceback is extended with the await chain of the tasks waiting for it
+    instead of the event loop frames. See current_async_stack.
+
+    :param bool detached: If the frames should be replaced by snapshots.
+    :return: The exception type, value and full traceback
     """
     t, v, tb = sys.exc_info()
-    full_tb = extend_traceback(tb, current_stack(1))
+    full_tb = extend_traceback(tb, current_async_stack(1), detached)
     return t, v, full_tb
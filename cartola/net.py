@@ -14,11 +14,22 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import errno
+import itertools
 import logging
+import math
 import os
 import platform
-from socket import AF_INET, SOCK_STREAM, socket
+from socket import (AF_INET, gethostbyname, IPPROTO_ICMP, MSG_PEEK,
+                    SOCK_DGRAM, SOCK_STREAM, socket, timeout as socket_timeout)
+import struct
 import subprocess
+import threading
+import time
 
 
 logger = logging.getLogger(__name__)
@@ -28,36 +39,803 @@ FIXTURES_ROOT = os.path.join(TEST_ROOT, "fixtures")
 PROJECT_ROOT = os.path.abspath(os.path.join(TEST_ROOT, ".."))
 
 
-def is_host_up(host, port):
+HostStatus = namedtuple("HostStatus", ["host", "port", "up", "error"])
+
+
+def _timed_connect(host, port, timeout=None):
+    """ Connect to a host and port returning the connect_ex result, the
+    seconds taken and the socket, that must be closed by the caller.
+    """
+    s = socket(AF_INET, SOCK_STREAM)
+    try:
+        if timeout is not None:
+            s.settimeout(timeout)
+        start = time.perf_counter()
+        result = s.connect_ex((host, int(port)))
+        return result, time.perf_counter() - start, s
+    except BaseException:
+        s.close()
+        raise
+
+
+def is_host_up(host, port, timeout=None):
     """
     See: https://bit.ly/2BgCpHI
     :param host:
     :param port:
+    :param float timeout: Seconds to wait for the connection. Default is to
+    block until the connection is established or refused.
     :return:
     """
-    s = socket(AF_INET, SOCK_STREAM)
-    result = s.connect_ex((host, int(port)))
+    result, _, s = _timed_connect(host, port, timeout)
+    s.close()
     if result == 0:
-        s.close()
         return True
-    elif result == 10035:
+    # 10035 is WSAEWOULDBLOCK returned by windows
+    elif result in (errno.EWOULDBLOCK, 10035):
         logger.warning("Timeout reached")
     else:
         logger.warning("Connection closed")
-    s.close()
     return False
 
 
-def ping(host):
+class LatencyHistogram(object):
+    """ Fixed size histogram of latencies, in the same spirit of a HDR
+    histogram.
+
+    Latencies are recorded in microseconds into log-linear buckets, each
+    power of two is split in four buckets, so a bucket bound has at most 25%
+    of error. The histogram covers from 1 microsecond to max_seconds using
+    around a hundred counters, latencies above max_seconds are counted in
+    the last bucket.
+    """
+
+    __slots__ = ("_counts", "_count", "_total", "_min", "_max")
+
+    SUB_BUCKET_BITS = 2
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+    def __init__(self, max_seconds=60):
+        self._counts = [0] * (self._index(int(max_seconds * 1e6)) + 1)
+        self._count = 0
+        self._total = 0
+        self._min = None
+        self._max = None
+
+    @classmethod
+    def _index(cls, micros):
+        if micros < cls.SUB_BUCKETS:
+            return max(micros, 0)
+        shift = micros.bit_length() - 1 - cls.SUB_BUCKET_BITS
+        return (shift << cls.SUB_BUCKET_BITS) + (micros >> shift)
+
+    @classmethod
+    def _upper_bound(cls, index):
+        """ Return the highest microseconds value counted by a bucket. """
+        if index < cls.SUB_BUCKETS:
+            return index
+        shift, sub_bucket = divmod(index, cls.SUB_BUCKETS)
+        shift -= 1
+        return ((cls.SUB_BUCKETS + sub_bucket + 1) << shift) - 1
+
+    @property
+    def count(self):
+        return self._count
+
+    def record(self, seconds):
+        """ Record a latency.
+
+        :param float seconds: The latency in seconds.
+        """
+        micros = int(seconds * 1e6)
+        index = min(self._index(micros), len(self._counts) - 1)
+        self._counts[index] += 1
+        self._count += 1
+        self._total += seconds
+        if self._min is None or seconds < self._min:
+            self._min = seconds
+        if self._max is None or seconds > self._max:
+            self._max = seconds
+
+    def percentile(self, percentile):
+        """ Return the bucket upper bound, in seconds, where the percentile
+        of the recorded latencies is found or None if nothing was recorded.
+
+        :param float percentile: A percentile from 0 to 100.
+        :return float: The latency in seconds
+        """
+        if self._count == 0:
+            return None
+        threshold = max(1, math.ceil(self._count * percentile / 100))
+        seen = 0
+        last_index = len(self._counts) - 1
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= threshold:
+                # The last bucket also counts latencies above max_seconds
+                if index == last_index:
+                    return self._max
+                return min(self._upper_bound(index) / 1e6, self._max)
+        return self._max
+
+    def buckets(self):
+        """ Return the non empty buckets.
+
+        :return dict: Counts indexed by the bucket upper bound in seconds.
+        """
+        return {self._upper_bound(index) / 1e6: count
+                for index, count in enumerate(self._counts) if count}
+
+    def snapshot(self):
+        """ Return the histogram summary.
+
+        :return dict: Count, min, max, mean, p50, p90, p99 and buckets.
+        """
+        return {
+            'count': self._count,
+            'min': self._min,
+            'max': self._max,
+            'mean': self._total / self._count if self._count else None,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': self.buckets(),
+        }
+
+
+class _TargetHealth(object):
+
+    __slots__ = ("histogram", "successes", "failures", "last_error")
+
+    def __init__(self, max_seconds):
+        self.histogram = LatencyHistogram(max_seconds)
+        self.successes = 0
+        self.failures = 0
+        self.last_error = None
+
+
+class HostHealth(object):
+    """ Probes hosts as is_host_up does, recording for each host and port
+    the connection latency histogram, the success ratio and the last error
+    code.
+
+    Only successful connections have their latency recorded.
+
+    Example:
+    >>> health = HostHealth()
+    >>> health.probe("candango.org", 80)
+    >>> health.snapshot()[("candango.org", 80)]['latency']['p99']
+    """
+
+    def __init__(self, max_seconds=60):
+        """
+        :param float max_seconds: Highest latency tracked by the histograms.
+        """
+        self._max_seconds = max_seconds
+        self._targets = {}
+        self._lock = threading.Lock()
+
+    def _target(self, key):
+        target = self._targets.get(key)
+        if target is None:
+            with self._lock:
+                target = self._targets.setdefault(
+                    key, _TargetHealth(self._max_seconds))
+        return target
+
+    def record(self, host, port, latency=None, error=None):
+        """ Record the result of a connection to a host.
+
+        :param str host:
+        :param int|str port:
+        :param float latency: Seconds taken by a successful connection.
+        :param int error: The error code of a failed connection.
+        """
+        target = self._target((host, int(port)))
+        with self._lock:
+            if error is None:
+                target.successes += 1
+                if latency is not None:
+                    target.histogram.record(latency)
+            else:
+                target.failures += 1
+                target.last_error = error
+
+    def probe(self, host, port, timeout=1.0):
+        """ Return if a host is up recording the connection result.
+
+        :param str host:
+        :param int|str port:
+        :param float timeout: Seconds to wait for the connection.
+        :return bool: True if the host is up
+        """
+        try:
+            result, latency, s = _timed_connect(host, port, timeout)
+        except OSError as error:
+            self.record(host, port, error=error.errno)
+            return False
+        s.close()
+        if result == 0:
+            self.record(host, port, latency)
+            return True
+        self.record(host, port, error=result)
+        return False
+
+    def reset(self):
+        with self._lock:
+            self._targets.clear()
+
+    def snapshot(self):
+        """ Return the health statistics of each host and port.
+
+        :return dict: Statistics indexed by host and port tuples with the
+        probe count, successes, failures, success ratio, last error code and
+        name and the latency histogram snapshot.
+        """
+        with self._lock:
+            snapshot = {}
+            for key, target in self._targets.items():
+                count = target.successes + target.failures
+                snapshot[key] = {
+                    'count': count,
+                    'successes': target.successes,
+                    'failures': target.failures,
+                    'success_ratio': (target.successes / count if count else
+                                      None),
+                    'last_error': target.last_error,
+                    'last_error_name': errno.errorcode.get(
+                        target.last_error),
+                    'latency': target.histogram.snapshot(),
+                }
+            return snapshot
+
+
+class _InFlightCheck(object):
+
+    __slots__ = ("event", "up", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.up = False
+        self.error = None
+
+
+class ReachabilityCache(object):
+    """ Shares the results of checking if hosts are up between many
+    components.
+
+    A host found up is cached for ttl seconds. A host found down is cached
+    with an exponential backoff, starting with backoff seconds and doubling
+    after each consecutive failed check up to max_backoff seconds.
+
+    Concurrent checks for the same host and port are coalesced, only one
+    thread probes the host while the other threads wait for its result.
+
+    Example:
+    >>> reachability = ReachabilityCache(ttl=5)
+    >>> if reachability.is_up("candango.org", 80):
+    >>>     print("Candango is up")
+    """
+
+    def __init__(self, ttl=5.0, backoff=1.0, max_backoff=60.0, timeout=1.0,
+                 checker=None, clock=None):
+        """
+        :param float ttl: Seconds a host found up is cached.
+        :param float backoff: Seconds a host found down is cached after the
+        first failed check.
+        :param float max_backoff: Maximum seconds a host found down is cached.
+        :param float timeout: Seconds to wait for the connection when
+        checking a host with is_host_up.
+        :param callable checker: Function receiving host and port returning
+        if the host is up. Default is is_host_up.
+        :param callable clock: Function returning the current time in seconds.
+        Default is time.monotonic.
+        """
+        self._ttl = ttl
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        if checker is None:
+            def checker(host, port):
+                return is_host_up(host, port, timeout)
+        self._checker = checker
+        self._clock = time.monotonic if clock is None else clock
+        self._entries = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._checks = 0
+        self._coalesced = 0
+
+    @property
+    def stats(self):
+        """ Return the cache counters.
+
+        :return dict: Cache hits, checks performed and checks coalesced into
+        a check already in flight.
+        """
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'checks': self._checks,
+                'coalesced': self._coalesced,
+            }
+
+    def failures(self, host, port):
+        """ Return how many consecutive checks found the host down. """
+        entry = self._entries.get((host, int(port)))
+        return 0 if entry is None else entry[2]
+
+    def invalidate(self, host=None, port=None):
+        """ Remove a host and port from the cache. If no host is informed
+        all the cache is cleared.
+        """
+        with self._lock:
+            if host is None:
+                self._entries.clear()
+                return
+            self._entries.pop((host, int(port)), None)
+
+    def is_up(self, host, port):
+        """ Return if the host is up, using the cached result if it didn't
+        expire.
+
+        :param str host:
+        :param int|str port:
+        :return bool: True if the host is up
+        """
+        key = (host, int(port))
+        owner = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > self._clock():
+                self._hits += 1
+                return entry[0]
+            check = self._in_flight.get(key)
+            if check is None:
+                check = self._in_flight[key] = _InFlightCheck()
+                self._checks += 1
+                owner = True
+            else:
+                self._coalesced += 1
+        if not owner:
+            check.event.wait()
+            if check.error is not None:
+                raise check.error
+            return check.up
+        try:
+            up = bool(self._checker(host, port))
+        except OSError as error:
+            logger.debug("Error checking if %s:%s is up: %s", host, port,
+                         error)
+            up = False
+        except Exception as error:
+            with self._lock:
+                del self._in_flight[key]
+            check.error = error
+            check.event.set()
+            raise
+        with self._lock:
+            failures = 0 if up else (0 if entry is None else entry[2]) + 1
+            if up:
+                expires = self._clock() + self._ttl
+            else:
+                expires = self._clock() + min(
+                    self._backoff * 2 ** min(failures - 1, 32),
+                    self._max_backoff)
+            self._entries[key] = (up, expires, failures)
+            del self._in_flight[key]
+        check.up = up
+        check.event.set()
+        return up
+
+
+def _is_socket_alive(sock):
+    """ Return True if a connected socket is still open and has no unread
+    data, checking it without blocking.
+    """
+    timeout = sock.gettimeout()
+    try:
+        sock.setblocking(False)
+        sock.recv(1, MSG_PEEK)
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+    finally:
+        if sock.fileno() != -1:
+            sock.settimeout(timeout)
+    # Either the peer closed the connection or sent data nobody read
+    return False
+
+
+class ConnectionPool(object):
+    """ Thread safe pool of tcp connections indexed by host and port.
+
+    New connections are established as is_host_up does. Released
+    connections are kept idle, up to max_size per host and port, and reused
+    by the next acquire for the same host and port if they didn't stay idle
+    longer than idle_timeout and are still alive.
+
+    Example:
+    >>> pool = ConnectionPool(max_size=4, idle_timeout=30)
+    >>> with pool.connection("localhost", 6379) as sock:
+    >>>     sock.sendall(b"PING\\r\\n")
+    >>>     sock.recv(1024)
+    >>> pool.stats
+    {'created': 1, 'reused': 0, 'expired': 0, 'discarded': 0, 'idle': 1}
+    """
+
+    def __init__(self, max_size=8, idle_timeout=60.0, timeout=None,
+                 clock=None):
+        """
+        :param int max_size: Maximum number of idle connections kept per
+        host and port.
+        :param float idle_timeout: Seconds a connection can stay idle before
+        it is closed.
+        :param float timeout: Seconds to wait for new connections. Default is
+        to block until the connection is established or refused.
+        :param callable clock: Function returning the current time in seconds.
+        Default is time.monotonic.
+        """
+        self._max_size = max_size
+        self._idle_timeout = idle_timeout
+        self._timeout = timeout
+        self._clock = time.monotonic if clock is None else clock
+        self._idle = {}
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._created = 0
+        self._reused = 0
+        self._expired = 0
+        self._discarded = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def stats(self):
+        """ Return the pool counters.
+
+        :return dict: Connections created, reused, closed after idle timeout,
+        discarded because they were not alive and currently idle.
+        """
+        with self._lock:
+            return {
+                'created': self._created,
+                'reused': self._reused,
+                'expired': self._expired,
+                'discarded': self._discarded,
+                'idle': sum(len(idle) for idle in self._idle.values()),
+            }
+
+    def acquire(self, host, port):
+        """ Return a connection to the host and port, reusing an idle
+        connection if possible. The connection must be returned to the pool
+        with release.
+
+        :param str host:
+        :param int|str port:
+        :return socket: The connected socket
+        """
+        key = (host, int(port))
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    break
+                sock, released_at = idle.pop()
+                if self._clock() - released_at > self._idle_timeout:
+                    self._expired += 1
+                    sock.close()
+                    continue
+            if not _is_socket_alive(sock):
+                sock.close()
+                with self._lock:
+                    self._discarded += 1
+                continue
+            with self._lock:
+                self._reused += 1
+                self._keys[sock] = key
+            return sock
+        result, _, sock = _timed_connect(host, port, self._timeout)
+        if result != 0:
+            sock.close()
+            raise OSError(result, os.strerror(result))
+        if self._timeout is not None:
+            sock.settimeout(None)
+        with self._lock:
+            self._created += 1
+            self._keys[sock] = key
+        return sock
+
+    def release(self, sock, reuse=True):
+        """ Return a connection to the pool. The connection is closed if it
+        shouldn't be reused, was closed or the host and port already have
+        max_size idle connections.
+
+        :param socket sock: The socket returned by acquire.
+        :param bool reuse: If the connection can be reused.
+        """
+        with self._lock:
+            key = self._keys.pop(sock, None)
+            if reuse and key is not None and sock.fileno() != -1:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self._max_size:
+                    idle.append((sock, self._clock()))
+                    return
+        sock.close()
+
+    @contextlib.contextmanager
+    def connection(self, host, port):
+        """ Context manager acquiring a connection and releasing it when
+        done. If an exception is raised the connection is closed instead of
+        reused.
+
+        :param str host:
+        :param int|str port:
+        :return socket: The connected socket
+        """
+        sock = self.acquire(host, port)
+        try:
+            yield sock
+        except BaseException:
+            self.release(sock, reuse=False)
+            raise
+        self.release(sock)
+
+    def prune(self):
+        """ Close the connections idle longer than idle_timeout. """
+        now = self._clock()
+        with self._lock:
+            for key, idle in self._idle.items():
+                alive = []
+                for sock, released_at in idle:
+                    if now - released_at > self._idle_timeout:
+                        self._expired += 1
+                        sock.close()
+                    else:
+                        alive.append((sock, released_at))
+                self._idle[key] = alive
+
+    def close(self):
+        """ Close all idle connections. """
+        with self._lock:
+            for idle in self._idle.values():
+                for sock, _ in idle:
+                    sock.close()
+            self._idle.clear()
+
+
+async def _probe_host(host, port, timeout, semaphore):
+    async with semaphore:
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, int(port)), timeout)
+        except asyncio.TimeoutError as error:
+            return HostStatus(host, port, False, error)
+        except OSError as error:
+            return HostStatus(host, port, False, error)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return HostStatus(host, port, True, None)
+
+
+async def scan_hosts(targets, timeout=1.0, concurrency=100):
+    """ Probe if many hosts are up concurrently, yielding the results as they
+    complete.
+
+    Each host is probed with a tcp connection, as is_host_up does, without
+    blocking the event loop.
+
+    Example:
+    >>> async for status in scan_hosts([("candango.org", 80),
+    >>>                                 ("candango.org", 443)]):
+    >>>     print(status.host, status.port, status.up)
+
+    :param targets: Iterable of host and port tuples.
+    :param float timeout: Seconds to wait for each connection.
+    :param int concurrency: Maximum number of connections being established
+    at the same time.
+    :return: The host status with the host, port, if it is up and the error
+    raised trying to connect to the host.
+    :rtype: HostStatus
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [asyncio.ensure_future(_probe_host(host, port, timeout,
+                                               semaphore))
+             for host, port in targets]
+    try:
+        for task in asyncio.as_completed(tasks):
+            yield await task
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def scan_hosts_up(targets, timeout=1.0, concurrency=100):
+    """ Probe if many hosts are up concurrently. See scan_hosts.
+
+    This function runs its own event loop and must not be called from a
+    running event loop.
+
+    :param targets: Iterable of host and port tuples.
+    :param float timeout: Seconds to wait for each connection.
+    :param int concurrency: Maximum number of connections being established
+    at the same time.
+    :return dict: If each host is up indexed by host and port tuples.
+    """
+    async def scan():
+        return {(status.host, status.port): status.up
+                async for status in scan_hosts(targets, timeout,
+                                               concurrency)}
+    return asyncio.run(scan())
+
+
+PingResult = namedtuple("PingResult", ["host", "alive", "latency",
+                                       "method"])
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO_REQUEST = 8
+_ICMP_HEADER = struct.Struct("!BBHHH")
+_ICMP_PAYLOAD = b"cartola-ping"
+_icmp_sequence = itertools.count(1)
+
+
+def _icmp_checksum(data):
+    """ Return the internet checksum(RFC 1071) of the data. """
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack("!%dH" % (len(data) // 2), data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def _icmp_echo_request(identifier, sequence, payload=_ICMP_PAYLOAD):
+    header = _ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, identifier, sequence)
+    checksum = _icmp_checksum(header + payload)
+    return _ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, checksum, identifier,
+                             sequence) + payload
+
+
+def icmp_socket_available():
+    """ Returns True if unprivileged ICMP datagram sockets can be created.
+    On linux the user group must be in the net.ipv4.ping_group_range kernel
+    parameter.
+
+    :return bool: True if ICMP datagram sockets are available
+    """
+    try:
+        socket(AF_INET, SOCK_DGRAM, IPPROTO_ICMP).close()
+    except OSError:
+        return False
+    return True
+
+
+def _icmp_reply(data):
+    """ Return the type and sequence of an ICMP message received from a
+    datagram socket or None if it is too short.
+
+    Linux delivers the ICMP message only, while other systems, like macOS,
+    deliver it after the IPv4 header which is skipped.
+    """
+    offset = 0
+    if data and data[0] >> 4 == 4:
+        offset = (data[0] & 0x0f) * 4
+    if len(data) - offset < _ICMP_HEADER.size:
+        return None
+    icmp_type, _, _, _, sequence = _ICMP_HEADER.unpack_from(data, offset)
+    return icmp_type, sequence
+
+
+def _icmp_ping(address, timeout):
+    """ Send an ICMP echo request using a datagram socket and return the
+    latency in seconds or None if no reply was received.
+    """
+    sequence = next(_icmp_sequence) & 0xffff
+    with socket(AF_INET, SOCK_DGRAM, IPPROTO_ICMP) as sock:
+        start = time.perf_counter()
+        deadline = start + timeout
+        # The kernel sets the identifier with the socket port
+        sock.sendto(_icmp_echo_request(0, sequence), (address, 0))
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return None
+            sock.settimeout(remaining)
+            try:
+                data = sock.recv(1024)
+            except socket_timeout:
+                return None
+            if _icmp_reply(data) == (ICMP_ECHO_REPLY, sequence):
+                return time.perf_counter() - start
+
+
+def _subprocess_ping(host, timeout):
+    """ Run the system ping command without output and return the elapsed
+    time in seconds, including the process creation, or None if the host
+    didn't reply.
+    """
+    system = platform.system().lower()
+    if system == "windows":
+        command = ["ping", "-n", "1", "-w", str(int(timeout * 1000)), host]
+    elif system == "linux":
+        command = ["ping", "-c", "1", "-W", str(max(1, math.ceil(timeout))),
+                   host]
+    else:
+        command = ["ping", "-c", "1", host]
+    start = time.perf_counter()
+    try:
+        result = subprocess.run(command, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL,
+                                timeout=timeout + 1)
+    except subprocess.TimeoutExpired:
+        return None
+    except OSError as error:
+        logger.warning("Unable to run the ping command: %s", error)
+        return None
+    if result.returncode != 0:
+        return None
+    return time.perf_counter() - start
+
+
+def _ping_host(host, timeout, use_icmp):
+    if not use_icmp:
+        latency = _subprocess_ping(host, timeout)
+        return PingResult(host, latency is not None, latency, "subprocess")
+    try:
+        address = gethostbyname(host)
+        latency = _icmp_ping(address, timeout)
+    except OSError as error:
+        logger.debug("Unable to ping %s: %s", host, error)
+        latency = None
+    return PingResult(host, latency is not None, latency, "icmp")
+
+
+def ping_hosts(hosts, timeout=1.0, max_workers=16):
+    """ Ping many hosts concurrently.
+
+    Hosts are pinged in process using unprivileged ICMP datagram sockets
+    when the kernel allows it, if not, the system ping command is used.
+    In both cases no output is written to stdout. A thread pool limits how
+    many hosts are pinged, or ping processes are running, at the same time.
+
+    Example:
+    >>> for result in ping_hosts(["candango.org", "github.com"]):
+    >>>     print(result.host, result.alive, result.latency)
+
+    :param hosts: Iterable of host names or ips.
+    :param float timeout: Seconds to wait for each host reply.
+    :param int max_workers: Maximum number of hosts pinged at the same time.
+    :return list: The ping results, in the same order as the hosts, with
+    the host, if it is alive, the latency in seconds and the method, icmp
+    or subprocess, used to ping.
+    """
+    hosts = list(hosts)
+    if not hosts:
+        return []
+    use_icmp = icmp_socket_available()
+    with ThreadPoolExecutor(max_workers=max_workers,
+                            thread_name_prefix="cartola-ping") as executor:
+        return list(executor.map(
+            lambda host: _ping_host(host, timeout, use_icmp), hosts))
+
+
+def ping(host, timeout=1.0):
     """ Returns True if host (str) responds to a ping request.
     Remember that a host may not respond to a ping (ICMP) request even if the
     host name is valid.
-    Base on https://bit.ly/2TmgeX2 but with pexpect
+
+    See ping_hosts.
+
     :param str host: A host name or ip
+    :param float timeout: Seconds to wait for the host reply.
     :return boolean: True if ping is replied correctly
     """
-    # Option for the number of packets as a function of
-    param = '-n' if platform.system().lower() == 'windows' else '-c'
-    # Building the command. Ex: "ping -c 1 example.com"
-    command = ['ping', param, '1', host]
-    return subprocess.call(command) == 0
+    return ping_hosts([host], timeout, 1)[0].alive
@@ -18,11 +18,16 @@
 Config functions tests
 """
 
-from tests import get_fixture_path
+from tests import get_fixture_path, get_sandbox_path, safe_remove
 from tests import fixtures
-from cartola import config
+from cartola import config, fs
 import unittest
 import logging
+import os
+import tempfile
+import threading
+import time
+import yaml
 
 
 class ConfigGetFromTestCase(unittest.TestCase):
@@ -98,6 +103,109 @@ class ConfigGetFromTestCase(unittest.TestCase):
         self.assertEqual(fixtures.my_num_value, an_object.num_value)
 
 
+class ConfigReferenceCacheTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        config.set_reference_cache(True)
+        config.clear_reference_cache()
+        if hasattr(fixtures, "my_late_value"):
+            del fixtures.my_late_value
+
+    def test_cached_reference(self):
+        config.clear_reference_cache()
+        config.get_from_string("tests.fixtures.my_num_value")
+        config.get_from_module("tests.fixtures", "my_string_value")
+        self.assertIn("tests.fixtures.my_num_value",
+                      config._reference_cache)
+        self.assertIn(("tests.fixtures", "my_string_value"),
+                      config._reference_cache)
+        config.clear_reference_cache("tests.fixtures")
+        self.assertEqual({}, config._reference_cache)
+
+    def test_negative_cache(self):
+        self.assertIsNone(config.get_from_string(
+            "tests.fixtures.my_late_value"))
+        fixtures.my_late_value = "late"
+        self.assertIsNone(config.get_from_string(
+            "tests.fixtures.my_late_value"))
+        self.assertEqual("late", config.get_from_string(
+            "tests.fixtures.my_late_value", cache=False))
+        config.clear_reference_cache("tests.fixtures")
+        self.assertEqual("late", config.get_from_string(
+            "tests.fixtures.my_late_value"))
+
+    def test_disabled_cache(self):
+        config.set_reference_cache(False)
+        self.assertEqual(fixtures.my_num_value, config.get_from_dict(
+            {'module': "tests.fixtures", 'attr': "my_num_value"},
+            attr_index="attr"))
+        self.assertEqual({}, config._reference_cache)
+
+
+class ConfigGetFromStringsTestCase(unittest.TestCase):
+
+    def test_get_from_strings_list(self):
+        bulk = config.get_from_strings([
+            "tests.fixtures.my_num_value",
+            "tests.fixtures.MyClass",
+            "tests.fixtures.my_string_value1",
+            "tests.not_a_module.my_value",
+            "tests",
+        ], max_workers=2)
+        self.assertEqual(fixtures.my_num_value,
+                         bulk.results["tests.fixtures.my_num_value"])
+        self.assertEqual(fixtures.MyClass,
+                         bulk.results["tests.fixtures.MyClass"])
+        self.assertIsNone(bulk.results["tests.fixtures.my_string_value1"])
+        self.assertIsNone(bulk.results["tests"])
+        self.assertIsInstance(bulk.errors["tests.not_a_module.my_value"],
+                              ImportError)
+        self.assertEqual(["tests.fixtures", "tests.not_a_module"],
+                         sorted(bulk.timings))
+
+    def test_get_from_strings_dict(self):
+        bulk = config.get_from_strings({
+            'function': "tests.fixtures.my_function",
+            'list': "tests.fixtures.my_list_value",
+        })
+        self.assertEqual(fixtures.my_function, bulk.results['function'])
+        self.assertEqual(fixtures.my_list_value, bulk.results['list'])
+        self.assertEqual({}, bulk.errors)
+
+
+class ConfigLazyReferenceTestCase(unittest.TestCase):
+
+    def test_lazy_from_string(self):
+        my_function = config.lazy_from_string("tests.fixtures.my_function")
+        self.assertFalse(my_function.resolved)
+        self.assertEqual(fixtures.my_string_value, my_function())
+        self.assertTrue(my_function.resolved)
+        self.assertIsNone(config.lazy_from_string("tests").resolve())
+
+    def test_lazy_from_dict(self):
+        my_class = config.lazy_from_dict(
+            {'module': "tests.fixtures", 'class': "MyClass"},
+            attr_index="class")
+        self.assertEqual("MyClass", my_class.__name__)
+        self.assertEqual(fixtures.my_num_value, my_class().num_value)
+        my_value = config.lazy_from_dict(
+            {'reference': "tests.fixtures.my_dict_value"})
+        self.assertEqual(fixtures.my_dict_value, my_value.resolve())
+
+    def test_warm_up_references(self):
+        references = [
+            config.lazy_from_string("tests.fixtures.my_list_value"),
+            config.lazy_from_string("tests.fixtures.my_num_value"),
+            config.lazy_from_string("tests.not_a_module.my_value"),
+        ]
+        futures = config.warm_up_references(references, max_workers=2)
+        self.assertEqual(fixtures.my_list_value, futures[0].result())
+        self.assertEqual(fixtures.my_num_value, futures[1].result())
+        self.assertIsInstance(futures[2].exception(), ImportError)
+        self.assertTrue(references[0].resolved)
+        self.assertFalse(references[2].resolved)
+
+
 class ConfigLoadYamlTestCase(unittest.TestCase):
 
     def test_load_yaml_file(self):
@@ -105,6 +213,276 @@ class ConfigLoadYamlTestCase(unittest.TestCase):
         a_config = config.load_yaml_file(a_file_path)
         self.assertEqual(a_config['a']['item'], "a value")
 
+    def test_iter_yaml_file(self):
+        inventory_path = get_fixture_path("inventory.yml")
+        documents = config.iter_yaml_file(inventory_path)
+        self.assertEqual("web1", next(documents)['name'])
+        self.assertEqual(["db1", "spare"],
+                         [document['name'] for document in documents])
+
+    def test_iter_yaml_file_key_path(self):
+        inventory_path = get_fixture_path("inventory.yml")
+        self.assertEqual(["10.0.0.1", "10.0.0.2"], list(
+            config.iter_yaml_file(inventory_path, "network.address")))
+        self.assertEqual(["backup"], list(
+            config.iter_yaml_file(inventory_path, "roles.1")))
+        self.assertEqual(["web", "backup"], list(
+            config.iter_yaml_file(inventory_path, "roles.-1")))
+        for key_path in ("roles.--1", "roles.x", "roles.5"):
+            self.assertEqual([], list(
+                config.iter_yaml_file(inventory_path, key_path)))
+
+    def test_yaml_backend(self):
+        expected_backend = "libyaml" if yaml.__with_libyaml__ else "python"
+        self.assertEqual(expected_backend, config.yaml_backend())
+
+
+class ConfigCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.conf_path = get_sandbox_path("cached_conf.yml")
+        fs.s_write(self.conf_path, "a:\n  item: a value\n")
+
+    def tearDown(self):
+        safe_remove(self.conf_path)
+
+    def test_load_hit(self):
+        cache = config.ConfigCache()
+        a_config = cache.load(self.conf_path)
+        self.assertEqual(a_config['a']['item'], "a value")
+        self.assertIs(a_config, cache.load(self.conf_path))
+        self.assertEqual({'hits': 1, 'misses': 1, 'reparses': 0, 'size': 1},
+                         cache.stats)
+
+    def test_load_changed_file(self):
+        cache = config.ConfigCache()
+        cache.load(self.conf_path)
+        fs.s_write(self.conf_path, "a:\n  item: another value\n")
+        a_config = cache.load(self.conf_path)
+        self.assertEqual(a_config['a']['item'], "another value")
+        self.assertEqual(1, cache.stats['reparses'])
+
+    def test_lru_eviction(self):
+        cache = config.ConfigCache(max_size=1)
+        cache.load(self.conf_path)
+        cache.load(get_fixture_path("a_file.yml"))
+        self.assertEqual(1, len(cache))
+        cache.load(self.conf_path)
+        self.assertEqual(3, cache.stats['misses'])
+        self.assertEqual(0, cache.stats['hits'])
+
+    def test_invalidate(self):
+        cache = config.ConfigCache()
+        cache.load(self.conf_path)
+        cache.invalidate(self.conf_path)
+        self.assertEqual(0, len(cache))
+        cache.load(self.conf_path)
+        cache.invalidate()
+        self.assertEqual(0, len(cache))
+
+
+class ConfigSnapshotTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.conf_path = get_sandbox_path("snapshot_conf.yml")
+        self.snapshot_path = "%s%s" % (self.conf_path,
+                                       config.SNAPSHOT_EXTENSION)
+        fs.s_write(self.conf_path, "a:\n  item: a value\n")
+
+    def tearDown(self):
+        safe_remove(self.conf_path)
+        safe_remove(self.snapshot_path)
+
+    def test_load_writes_snapshot(self):
+        a_config = config.load_yaml_snapshot(self.conf_path)
+        self.assertEqual(a_config['a']['item'], "a value")
+        self.assertTrue(os.path.exists(self.snapshot_path))
+        self.assertEqual(a_config, config.load_yaml_snapshot(self.conf_path))
+
+    def test_load_from_snapshot(self):
+        self.assertTrue(config.write_yaml_snapshot(self.conf_path))
+        # Only the snapshot is able to return this value
+        signature = config._stat_signature(self.conf_path)
+        with open(self.snapshot_path, "rb") as f:
+            digest = config._SNAPSHOT_HEADER.unpack_from(f.read())[2]
+        config._write_snapshot(self.snapshot_path, digest, signature,
+                               {'a': {'item': "from snapshot"}})
+        a_config = config.load_yaml_snapshot(self.conf_path)
+        self.assertEqual(a_config['a']['item'], "from snapshot")
+
+    def test_changed_file_invalidates_snapshot(self):
+        config.load_yaml_snapshot(self.conf_path)
+        fs.s_write(self.conf_path, "a:\n  item: another value\n")
+        a_config = config.load_yaml_snapshot(self.conf_path)
+        self.assertEqual(a_config['a']['item'], "another value")
+
+    def test_unmarshallable_data(self):
+        fs.s_write(self.conf_path, "a:\n  date: 2020-01-01\n")
+        self.assertFalse(config.write_yaml_snapshot(self.conf_path))
+        a_config = config.load_yaml_snapshot(self.conf_path)
+        self.assertEqual(a_config['a']['date'].year, 2020)
+        self.assertFalse(os.path.exists(self.snapshot_path))
+
+
+class LayeredConfigTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.base = {
+            'database': {'host': "localhost", 'port': 5432},
+            'logging': {'level': "INFO", 'handlers': ["console"]},
+            'debug': False,
+        }
+        self.conf = config.LayeredConfig()
+        self.conf.add_layer("base", self.base)
+
+    def test_merge(self):
+        self.conf.add_layer("production", {
+            'database': {'host': "db.example.com"},
+            'debug': True,
+        })
+        self.assertEqual({'host': "db.example.com", 'port': 5432},
+                         self.conf['database'])
+        self.assertTrue(self.conf['debug'])
+        self.assertEqual(["base", "production"], self.conf.names)
+        # Subtrees defined by a single layer are shared
+        self.assertIs(self.base['logging'], self.conf['logging'])
+
+    def test_update_layer(self):
+        self.conf.add_layer("host", {'database': {'port': 6432}})
+        data = self.conf.data
+        keys = self.conf.update_layer("host", {'database': {'port': 6432},
+                                               'debug': True})
+        self.assertEqual({"debug"}, keys)
+        self.assertIs(data['database'], self.conf['database'])
+        self.assertFalse(data['debug'])
+        self.assertTrue(self.conf['debug'])
+
+    def test_remove_layer(self):
+        self.conf.add_layer("host", {'debug': True, 'extra': 1})
+        self.assertEqual({"debug", "extra"}, self.conf.remove_layer("host"))
+        self.assertFalse(self.conf['debug'])
+        self.assertNotIn("extra", self.conf)
+
+    def test_reload(self):
+        layer_path = get_sandbox_path("layer_conf.yml")
+        fs.s_write(layer_path, "debug: true\n")
+        try:
+            self.conf.add_layer("host", path=layer_path)
+            self.assertEqual([], self.conf.reload())
+            self.assertTrue(self.conf['debug'])
+            fs.s_write(layer_path, "debug: false\nextra: 1\n")
+            self.assertEqual(["host"], self.conf.reload())
+            self.assertFalse(self.conf['debug'])
+            self.assertEqual(1, self.conf['extra'])
+        finally:
+            safe_remove(layer_path)
+
+    def test_invalid_layer_not_added(self):
+        layer_path = get_sandbox_path("list_conf.yml")
+        fs.s_write(layer_path, "- debug\n")
+        try:
+            for kwargs in ({'data': ["debug"]}, {'path': layer_path}):
+                with self.assertRaises(TypeError):
+                    self.conf.add_layer("host", **kwargs)
+                self.assertEqual(["base"], self.conf.names)
+            self.assertEqual([], self.conf.reload())
+            self.conf.add_layer("host", {'debug': True})
+            self.assertTrue(self.conf['debug'])
+        finally:
+            safe_remove(layer_path)
+
+    def test_reload_empty_layer(self):
+        layer_path = get_sandbox_path("empty_conf.yml")
+        fs.s_write(layer_path, "")
+        try:
+            self.conf.add_layer("empty", path=layer_path)
+            self.assertEqual({}, self.conf.layer("empty"))
+            self.assertEqual([], self.conf.reload())
+            self.assertEqual([], self.conf.reload())
+            fs.s_write(layer_path, "debug: true\n")
+            self.assertEqual(["empty"], self.conf.reload())
+            self.assertTrue(self.conf['debug'])
+        finally:
+            safe_remove(layer_path)
+
+
+class ConfigReloaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.conf_path = get_sandbox_path("reloaded_conf.yml")
+        fs.s_write(self.conf_path, "a:\n  item: a value\n")
+        self.reloaded = threading.Event()
+
+    def tearDown(self):
+        safe_remove(self.conf_path)
+
+    def assert_reload(self, reloader):
+        def on_reload(path, data):
+            self.reloaded.set()
+        reloader.subscribe(on_reload)
+        with reloader:
+            a_config = reloader.get(self.conf_path)
+            self.assertEqual(a_config['a']['item'], "a value")
+            fs.s_write(self.conf_path, "a:\n  item: another value\n")
+            self.assertTrue(self.reloaded.wait(5))
+            # The previous structure isn't changed by the reload
+            self.assertEqual(a_config['a']['item'], "a value")
+            self.assertEqual(reloader[self.conf_path]['a']['item'],
+                             "another value")
+
+    def test_polling_reload(self):
+        reloader = config.ConfigReloader([self.conf_path], debounce=0.05,
+                                         interval=0.05, use_inotify=False)
+        self.assertEqual("polling", reloader.backend)
+        self.assert_reload(reloader)
+
+    @unittest.skipIf(config._inotify_libc() is None,
+                     "inotify isn't available")
+    def test_inotify_reload(self):
+        reloader = config.ConfigReloader([self.conf_path], debounce=0.05)
+        self.assert_reload(reloader)
+        self.assertEqual("inotify", reloader.backend)
+
+    @unittest.skipIf(config._inotify_libc() is None,
+                     "inotify isn't available")
+    def test_inotify_symlink_swap_reload(self):
+        """ Config map mounts swap the ..data symlink, the events are for
+        other names than the watched file. """
+        with tempfile.TemporaryDirectory() as directory:
+            for version, value in (("..v1", "a value"),
+                                   ("..v2", "another value")):
+                os.mkdir(os.path.join(directory, version))
+                fs.s_write(os.path.join(directory, version, "conf.yml"),
+                           "a:\n  item: %s\n" % value)
+            os.symlink("..v1", os.path.join(directory, "..data"))
+            conf_path = os.path.join(directory, "conf.yml")
+            os.symlink(os.path.join("..data", "conf.yml"), conf_path)
+            reloader = config.ConfigReloader([conf_path], debounce=0.05)
+            reloader.subscribe(lambda path, data: self.reloaded.set())
+            with reloader:
+                self.assertEqual("inotify", reloader.backend)
+                self.assertEqual(reloader[conf_path]['a']['item'],
+                                 "a value")
+                os.symlink("..v2", os.path.join(directory, "..data_tmp"))
+                os.rename(os.path.join(directory, "..data_tmp"),
+                          os.path.join(directory, "..data"))
+                self.assertTrue(self.reloaded.wait(5))
+                self.assertEqual(reloader[conf_path]['a']['item'],
+                                 "another value")
+
+    def test_parse_error_keeps_structure(self):
+        reloader = config.ConfigReloader([self.conf_path], debounce=0.05,
+                                         interval=0.05, use_inotify=False)
+        with reloader:
+            logging.disable(logging.ERROR)
+            try:
+                fs.s_write(self.conf_path, "a: [\n")
+                time.sleep(0.3)
+            finally:
+                logging.disable(logging.NOTSET)
+            self.assertEqual(reloader.get(self.conf_path)['a']['item'],
+                             "a value")
+
 
 class LogLevelTestCase(unittest.TestCase):
 
@@ -123,3 +501,20 @@ class LogLevelTestCase(unittest.TestCase):
                          config.log_level_from_string("CRITICAL"))
         self.assertEqual(logging.NOTSET,
                          config.log_level_from_string("NOTSET"))
+
+    def test_log_level_from_other_values(self):
+        self.assertEqual(logging.WARNING,
+                         config.log_level_from_string("warning"))
+        self.assertEqual(logging.INFO, config.log_level_from_string("20"))
+        self.assertEqual(logging.ERROR,
+                         config.log_level_from_string(logging.ERROR))
+        self.assertEqual(logging.NOTSET,
+                         config.log_level_from_string("NOT_A_LEVEL"))
+        self.assertEqual(logging.NOTSET, config.log_level_from_string(42))
+        self.assertEqual(logging.NOTSET, config.log_level_from_string([]))
+
+    def test_log_level_from_custom_level(self):
+        logging.addLevelName(25, "CARTOLA_NOTICE")
+        self.assertEqual(25, config.log_level_from_string("cartola_notice"))
+        self.assertEqual(25, config.log_level_from_string("25"))
+        self.assertEqual(25, config.log_level_from_string(25))
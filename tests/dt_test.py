@@ -19,6 +19,7 @@ Datetime tests
 """
 
 from cartola import dt
+from datetime import date, datetime, timedelta, timezone
 import unittest
 
 
@@ -35,3 +36,168 @@ class DtTestCase(unittest.TestCase):
         self.assertEqual(dt.last_day_of_month(2020, 2), 29)
         self.assertEqual(dt.last_day_of_month(2020, 9), 30)
         self.assertEqual(dt.last_day_of_month(2020, 10), 31)
+        self.assertEqual(dt.last_day_of_month(2021, 2), 28)
+        self.assertEqual(dt.last_day_of_month(1900, 2), 28)
+        self.assertEqual(dt.last_day_of_month(2000, 2), 29)
+        with self.assertRaises(ValueError):
+            dt.last_day_of_month(2020, 13)
+        with self.assertRaises(ValueError):
+            dt.complete_month(2020, 0)
+
+    def test_iter_months(self):
+        """ Month range iterator tests"""
+        self.assertEqual(
+            [(2020, 11), (2020, 12), (2021, 1), (2021, 2)],
+            list(dt.iter_months(date(2020, 11, 30), date(2021, 2, 1))))
+        self.assertEqual([], list(dt.iter_months(date(2021, 2, 1),
+                                                 date(2020, 11, 30))))
+
+    def test_iter_days(self):
+        """ Day range iterator tests"""
+        self.assertEqual(
+            [(2020, 2, 28), (2020, 2, 29), (2020, 3, 1)],
+            list(dt.iter_days(datetime(2020, 2, 28), date(2020, 3, 1))))
+        self.assertEqual(366, len(list(dt.iter_days(date(2020, 1, 1),
+                                                    date(2020, 12, 31)))))
+
+
+class DtBatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [
+            {'created': "2020-01-02 03:04:05"},
+            {'created': None},
+            {'created': datetime(2021, 6, 7)},
+            {},
+        ]
+
+    def test_extract_datetimes(self):
+        self.assertEqual(
+            [datetime(2020, 1, 2, 3, 4, 5), None, datetime(2021, 6, 7), None],
+            dt.extract_datetimes(self.records, "created",
+                                 "%Y-%m-%d %H:%M:%S"))
+
+    def test_parse_datetimes(self):
+        self.assertEqual([datetime(2020, 1, 2), datetime(2020, 12, 31)],
+                         dt.parse_datetimes(["02/01/2020", "31/12/2020"],
+                                            "%d/%m/%Y"))
+
+    @unittest.skipIf(dt.numpy is None, "NumPy isn't installed")
+    def test_extract_datetimes_array(self):
+        values = dt.extract_datetimes(self.records, "created",
+                                      "%Y-%m-%d %H:%M:%S", as_array=True)
+        self.assertEqual(dt.numpy.dtype("datetime64[us]"), values.dtype)
+        self.assertEqual(dt.numpy.datetime64("2020-01-02T03:04:05"),
+                         values[0])
+        self.assertTrue(dt.numpy.isnat(values[1]))
+
+
+class DtCompileMaskTestCase(unittest.TestCase):
+
+    def test_compiled_masks(self):
+        self.assertEqual(datetime(2020, 2, 29),
+                         dt.compile_mask("%Y-%m-%d")("2020-02-29"))
+        self.assertEqual(datetime(2020, 2, 29, 13, 14, 15),
+                         dt.compile_mask("%Y-%m-%d %H:%M:%S")(
+                             "2020-02-29 13:14:15"))
+        self.assertEqual(datetime(2020, 2, 29, 13, 14, 15, 120000),
+                         dt.compile_mask("%Y-%m-%dT%H:%M:%S.%f")(
+                             "2020-02-29T13:14:15.12"))
+        self.assertEqual(datetime(2020, 2, 29),
+                         dt.compile_mask("%d/%m/%Y")("29/02/2020"))
+        self.assertIs(dt.compile_mask("%d/%m/%Y"),
+                      dt.compile_mask("%d/%m/%Y"))
+
+    def test_strptime_fallback(self):
+        # Values without zero padding are parsed by strptime
+        self.assertEqual(datetime(2020, 2, 9),
+                         dt.compile_mask("%Y-%m-%d")("2020-2-9"))
+        self.assertEqual(datetime(2020, 2, 9),
+                         dt.compile_mask("%d %b %Y")("09 Feb 2020"))
+        with self.assertRaises(ValueError):
+            dt.compile_mask("%Y-%m-%d")("2021-02-29")
+        with self.assertRaises(ValueError):
+            dt.compile_mask("%Y-%m-%d")("2021-02-28 00:00")
+
+
+class DtBucketTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [
+            {'created': "2020-02-27", 'value': 1},
+            {'created': "2020-02-28", 'value': 2},
+            {'created': "2020-03-01", 'value': 3},
+            {'created': None, 'value': 4},
+            {'created': "2020-03-02", 'value': 5},
+        ]
+
+    def test_bucket_by_day(self):
+        buckets = dt.bucket_datetimes(iter(self.records), "created",
+                                      "%Y-%m-%d")
+        first_bucket = next(buckets)
+        self.assertEqual(dt.Bucket(date(2020, 2, 27), date(2020, 2, 27), 1),
+                         first_bucket)
+        self.assertEqual(3, len(list(buckets)))
+
+    def test_bucket_by_week(self):
+        buckets = list(dt.bucket_datetimes(
+            self.records, "created", "%Y-%m-%d", period="week",
+            reducer=lambda total, record: total + record['value']))
+        self.assertEqual([
+            dt.Bucket(date(2020, 2, 24), date(2020, 3, 1), 6),
+            dt.Bucket(date(2020, 3, 2), date(2020, 3, 8), 5),
+        ], buckets)
+
+    def test_bucket_by_month(self):
+        buckets = list(dt.bucket_datetimes(
+            self.records, "created", "%Y-%m-%d", period="month",
+            reducer=lambda values, record: values + [record['value']],
+            initial=list))
+        self.assertEqual([
+            dt.Bucket(date(2020, 2, 1), date(2020, 2, 29), [1, 2]),
+            dt.Bucket(date(2020, 3, 1), date(2020, 3, 31), [3, 5]),
+        ], buckets)
+
+    def test_bucket_out_of_order(self):
+        records = [self.records[2], self.records[0], self.records[1]]
+        buckets = list(dt.bucket_datetimes(records, "created", "%Y-%m-%d",
+                                           period="month"))
+        self.assertEqual([1, 2], [bucket.value for bucket in buckets])
+        buckets = list(dt.bucket_datetimes(records, "created", "%Y-%m-%d",
+                                           period="month", max_open=2))
+        self.assertEqual([2, 1], [bucket.value for bucket in buckets])
+        self.assertEqual(date(2020, 2, 1), buckets[0].start)
+
+
+class DtTimezoneTestCase(unittest.TestCase):
+
+    def test_get_timezone(self):
+        self.assertIs(timezone.utc, dt.get_timezone("UTC"))
+        if dt.ZoneInfo is not None:
+            self.assertIs(dt.get_timezone("America/Sao_Paulo"),
+                          dt.get_timezone("America/Sao_Paulo"))
+
+    def test_extract_datetime_tz(self):
+        tz = timezone(timedelta(hours=-3))
+        value = dt.extract_datetime_tz({'created': "2020-01-02 03:04:05"},
+                                       "created", "%Y-%m-%d %H:%M:%S", tz)
+        self.assertEqual(datetime(2020, 1, 2, 3, 4, 5, tzinfo=tz), value)
+        value = dt.extract_datetime_tz(
+            {'created': datetime(2020, 1, 2, 6, tzinfo=timezone.utc)},
+            "created", "%Y-%m-%d", tz)
+        self.assertEqual(3, value.hour)
+        self.assertIsNone(dt.extract_datetime_tz({}, "created", "%Y", tz))
+
+    @unittest.skipIf(dt.ZoneInfo is None, "zoneinfo isn't available")
+    def test_extract_datetimes_utc(self):
+        records = [
+            {'created': "2020-01-02 03:04:05"},
+            {'created': "2020-07-02 03:04:05"},
+            {'created': None},
+        ]
+        self.assertEqual([
+            datetime(2020, 1, 2, 8, 4, 5, tzinfo=timezone.utc),
+            datetime(2020, 7, 2, 7, 4, 5, tzinfo=timezone.utc),
+            None,
+        ], dt.extract_datetimes_utc(records, "created", "%Y-%m-%d %H:%M:%S",
+                                    "America/New_York"))
@@ -20,7 +20,11 @@ Datetime tests
 
 from tests import WarningsHandler
 from cartola import exception
+import asyncio
+import linecache
 import logging
+import sys
+import traceback
 import warnings
 import unittest
 
@@ -78,7 +82,7 @@ class ExceptionTestCase(unittest.TestCase):
 
     def test_stack(self):
         """ Checking if full_exc_info will return the division by 0 error at
-        line 83. If the line changes this test will fail."""
+        line 87. If the line changes this test will fail."""
         try:
             1/0
         except ZeroDivisionError:
@@ -96,4 +100,364 @@ class ExceptionTestCase(unittest.TestCase):
                 self.assertEqual(
                     tb_frame.tb_frame.f_locals['record'].exc_info[0],
                     ZeroDivisionError)
-                self.assertEqual(tb_frame.tb_lineno, 83)
+                self.assertEqual(tb_frame.tb_lineno, 87)
+
+
+class CurrentStackTestCase(unittest.TestCase):
+
+    def inner_stack(self, **kwargs):
+        return exception.current_stack(**kwargs)
+
+    def test_current_stack(self):
+        line, stack = sys._getframe().f_lineno, self.inner_stack()
+        # Starts from the caller of the function calling current_stack
+        self.assertIs(sys._getframe(), stack[0][0])
+        self.assertEqual(line, stack[0][1])
+        self.assertEqual(len(stack), len(self.inner_stack(skip=1)) + 1)
+        self.assertEqual([], self.inner_stack(skip=1000))
+
+    def test_current_stack_max_depth(self):
+        stack = self.inner_stack(max_depth=2)
+        self.assertEqual(2, len(stack))
+        self.assertIs(sys._getframe(1), stack[1][0])
+
+    def test_current_stack_lazy(self):
+        stack = self.inner_stack(lazy=True)
+        self.assertNotIsInstance(stack, list)
+        self.assertEqual([frame for frame, _ in self.inner_stack()],
+                         [frame for frame, _ in stack])
+
+
+class FullExcInfoTestCase(unittest.TestCase):
+
+    def raise_error(self, detached=False):
+        try:
+            1/0
+        except ZeroDivisionError:
+            return exception.full_exc_info(detached)
+
+    def test_format_full_exc_info(self):
+        lines = "".join(traceback.format_exception(*self.raise_error()))
+        self.assertIn("in raise_error", lines)
+        self.assertIn("in test_format_full_exc_info", lines)
+        self.assertIn("1/0", lines)
+
+    def test_full_exc_info_detached(self):
+        exc_info = self.raise_error(detached=True)
+        self.assertIs(ZeroDivisionError, exc_info[0])
+        tb = exc_info[2]
+        names = []
+        while tb is not None:
+            self.assertIsInstance(tb, exception.FauxTb)
+            self.assertIsInstance(tb.tb_frame, exception.FauxFrame)
+            self.assertEqual({}, dict(tb.tb_frame.f_locals))
+            self.assertEqual(tb.tb_lineno, tb.tb_frame.f_lineno)
+            names.append(tb.tb_frame.f_code.co_name)
+            tb = tb.tb_next
+        self.assertEqual(["test_full_exc_info_detached", "raise_error"],
+                         names[-2:])
+        lines = "".join(traceback.format_exception(*exc_info))
+        self.assertIn("in raise_error", lines)
+        self.assertIn("1/0", lines)
+        with self.assertRaises(AttributeError):
+            exception.FauxTb(None, 1, None).tb_extra = None
+
+
+class DedupExceptionLoggerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = [0.0]
+        self.logger = logging.getLogger("tests.exception_test.dedup")
+        self.dedup = exception.DedupExceptionLogger(
+            self.logger, window=10, max_fingerprints=2,
+            clock=lambda: self.now[0])
+
+    def fail_at(self, where, error=ZeroDivisionError, times=1):
+        """ Repeats the same failure from the same call site. """
+        results = []
+        for _ in range(times):
+            try:
+                raise error(where)
+            except error:
+                results.append(self.dedup.exception("Failed at %s", where))
+        return results
+
+    def test_logs_traceback_once(self):
+        with self.assertLogs(self.logger) as logs:
+            results = self.fail_at("a", times=5)
+        self.assertEqual([True, False, False, False, False], results)
+        self.assertEqual(1, len(logs.records))
+        self.assertIn("Failed at a", logs.output[0])
+        self.assertIn("in fail_at", logs.output[0])
+        self.assertIn("in test_logs_traceback_once", logs.output[0])
+
+    def test_fingerprint_by_type_and_location(self):
+        with self.assertLogs(self.logger) as logs:
+            for error in (ZeroDivisionError, ValueError, ZeroDivisionError):
+                self.fail_at("a", error)
+            # Same exception raised from another call site
+            self.fail_at("a")
+        self.assertEqual(3, len(logs.records))
+        self.assertEqual(2, len(self.dedup))
+
+    def test_repeats_per_window(self):
+        with self.assertLogs(self.logger) as logs:
+            for now in (0, 1, 2, 3, 10.5, 11):
+                self.now[0] = now
+                self.fail_at("a")
+        self.assertEqual(2, len(logs.records))
+        self.assertIsNone(logs.records[1].exc_info)
+        self.assertIn("Failed at a (repeated 4 times in the last 10.5 "
+                      "seconds)", logs.output[1])
+        self.now[0] = 12
+        with self.assertLogs(self.logger) as logs:
+            self.dedup.flush()
+        self.assertEqual(1, len(logs.records))
+        self.assertIn("(repeated 1 times in the last 1.5 seconds)",
+                      logs.output[0])
+
+    def test_eviction_flushes(self):
+        with self.assertLogs(self.logger) as logs:
+            for error in (ZeroDivisionError, ZeroDivisionError, KeyError,
+                          TypeError):
+                self.fail_at("a", error)
+        self.assertEqual(2, len(self.dedup))
+        self.assertIn("Failed at a (repeated 1 times", logs.output[-2])
+        self.assertIn("TypeError", logs.output[-1])
+
+    def test_identical_functions_in_other_files(self):
+        handlers = identical_handlers()
+        # Code objects are equal regardless of the file name
+        self.assertEqual(handlers[0].__code__, handlers[1].__code__)
+        results = []
+        with self.assertLogs(self.logger) as logs:
+            for handler in handlers:
+                try:
+                    handler(0)
+                except ZeroDivisionError:
+                    results.append(self.dedup.exception("Failed"))
+        self.assertEqual([True, True], results)
+        self.assertIn("moda.py", logs.output[0])
+        self.assertIn("modb.py", logs.output[1])
+
+    def test_mapping_argument(self):
+        with self.assertLogs(self.logger) as logs:
+            for _ in range(3):
+                try:
+                    1/0
+                except ZeroDivisionError:
+                    self.dedup.exception("Failed %(who)s", {'who': "me"})
+            self.dedup.flush()
+        self.assertIn("Failed me", logs.output[0])
+        self.assertIn("Failed me (repeated 2 times", logs.output[1])
+
+    def test_expired_windows_logged_by_other_fingerprints(self):
+        with self.assertLogs(self.logger) as logs:
+            for now, error in ((0, KeyError), (1, KeyError), (2, KeyError),
+                               (11, TypeError)):
+                self.now[0] = now
+                self.fail_at("a", error)
+        self.assertEqual(3, len(logs.records))
+        self.assertIn("KeyError", logs.output[0])
+        self.assertIn("Failed at a (repeated 2 times in the last 11.0 "
+                      "seconds)", logs.output[1])
+        self.assertIn("TypeError", logs.output[2])
+        self.now[0] = 12
+        with self.assertLogs(self.logger) as logs:
+            self.dedup.flush()
+            self.logger.error("Nothing pending")
+        self.assertEqual(1, len(logs.records))
+
+    def test_caller_location(self):
+        with self.assertLogs(self.logger) as logs:
+            self.fail_at("a", times=2)
+            self.dedup.flush()
+            flush_line = sys._getframe().f_lineno - 1
+        self.assertEqual(2, len(logs.records))
+        self.assertEqual(("fail_at", __file__),
+                         (logs.records[0].funcName,
+                          logs.records[0].pathname))
+        self.assertEqual(("test_caller_location", flush_line),
+                         (logs.records[1].funcName, logs.records[1].lineno))
+
+    def test_bad_format_handled_by_logging(self):
+        class FormattingHandler(logging.Handler):
+            def __init__(self):
+                super(FormattingHandler, self).__init__()
+                self.errors = []
+
+            def emit(self, record):
+                try:
+                    self.format(record)
+                except Exception:
+                    self.handleError(record)
+
+            def handleError(self, record):
+                self.errors.append(record)
+
+        handler = FormattingHandler()
+        self.logger.addHandler(handler)
+        try:
+            for _ in range(2):
+                try:
+                    1/0
+                except ZeroDivisionError:
+                    self.dedup.exception("bad %d", "notanint")
+            self.dedup.flush()
+        finally:
+            self.logger.removeHandler(handler)
+        self.assertEqual(2, len(handler.errors))
+        self.assertEqual("bad %d (repeated 1 times in the last 0.0 seconds)",
+                         handler.errors[1].msg)
+
+
+class TracebackRecordsTestCase(unittest.TestCase):
+
+    def recurse(self, depth):
+        if depth:
+            return self.recurse(depth - 1)
+        try:
+            raise ValueError("Deep")
+        except ValueError:
+            return exception.format_exc_info_records()
+
+    def raise_recursive(self, depth):
+        if depth:
+            self.raise_recursive(depth - 1)
+        raise ValueError("Deep")
+
+    def test_format_exc_info_records(self):
+        try:
+            1/0
+        except ZeroDivisionError:
+            exc_record = exception.format_exc_info_records()
+        self.assertEqual("ZeroDivisionError", exc_record['type'])
+        self.assertEqual("division by zero", exc_record['message'])
+        self.assertEqual(0, exc_record['omitted'])
+        frame = exc_record['frames'][-1]
+        self.assertEqual(__file__, frame['filename'])
+        self.assertEqual("test_format_exc_info_records", frame['name'])
+        self.assertEqual("1/0", frame['line'])
+        self.assertEqual(0, frame['repeated'])
+        # Extended with the current stack
+        self.assertGreater(len(exc_record['frames']), 1)
+
+    def test_collapse_recursion(self):
+        frames = self.recurse(30)['frames']
+        self.assertEqual(["test_collapse_recursion", "recurse", "recurse"],
+                         [frame['name'] for frame in frames[-3:]])
+        self.assertEqual(29, frames[-2]['repeated'])
+        self.assertEqual('raise ValueError("Deep")', frames[-1]['line'])
+
+    def test_no_collapse_recursion(self):
+        try:
+            self.raise_recursive(5)
+        except ValueError:
+            tb = sys.exc_info()[2]
+        collapsed = exception.format_traceback_records(tb)
+        frames = exception.format_traceback_records(
+            tb, collapse_recursion=False)
+        # The five recursive calls collapse, the raise line is a new entry
+        self.assertEqual(4, collapsed[-2]['repeated'])
+        self.assertEqual(len(collapsed) + 4, len(frames))
+        self.assertEqual(["raise_recursive"] * 6,
+                         [frame['name'] for frame in frames[-6:]])
+
+    def test_max_frames_and_detached(self):
+        try:
+            self.recurse(3)
+            raise KeyError("key")
+        except KeyError:
+            exc_info = exception.full_exc_info(detached=True)
+        exc_record = exception.format_exc_info_records(
+            exc_info, max_frames=1)
+        self.assertEqual("KeyError", exc_record['type'])
+        self.assertEqual(1, len(exc_record['frames']))
+        self.assertGreater(exc_record['omitted'], 0)
+        self.assertEqual('raise KeyError("key")',
+                         exc_record['frames'][0]['line'])
+        # Detached frames with the same code share the cached render
+        code = exc_info[2].tb_frame.f_code
+        self.assertEqual(exception.FauxCode(code), code)
+        self.assertEqual(hash(exception.FauxCode(code)), hash(code))
+        exception.clear_line_cache()
+
+    def test_identical_functions_in_other_files(self):
+        linecache.cache.update(
+            ("/tmp/cartola_%s.py" % name,
+             (0, None, ["def handler(x):\n", "    return 1 / x  # %s\n" %
+                        name], "/tmp/cartola_%s.py" % name))
+            for name in ("moda", "modb"))
+        records = []
+        for handler in identical_handlers():
+            try:
+                handler(0)
+            except ZeroDivisionError:
+                records.append(exception.format_traceback_records(
+                    sys.exc_info()[2])[-1])
+        self.assertEqual("/tmp/cartola_moda.py", records[0]['filename'])
+        self.assertEqual("return 1 / x  # moda", records[0]['line'])
+        self.assertEqual("/tmp/cartola_modb.py", records[1]['filename'])
+        self.assertEqual("return 1 / x  # modb", records[1]['line'])
+        exception.clear_line_cache()
+
+
+class CurrentAsyncStackTestCase(unittest.TestCase):
+
+    async def inner(self):
+        await asyncio.sleep(0)
+        try:
+            1/0
+        except ZeroDivisionError:
+            return exception.full_async_exc_info()
+
+    async def middle(self):
+        return await asyncio.ensure_future(self.inner())
+
+    async def outer(self):
+        return await self.middle()
+
+    def test_full_async_exc_info(self):
+        exc_info = asyncio.run(self.outer())
+        self.assertIs(ZeroDivisionError, exc_info[0])
+        names = []
+        tb = exc_info[2]
+        while tb is not None:
+            names.append(tb.tb_frame.f_code.co_name)
+            tb = tb.tb_next
+        # The awaiting task chain replaces the event loop frames
+        self.assertEqual(["outer", "middle", "inner"], names)
+        lines = "".join(traceback.format_exception(*exc_info))
+        self.assertIn("return await self.middle()", lines)
+
+    def test_current_async_stack_max_depth(self):
+        async def capture(max_depth):
+            return exception.current_async_stack(max_depth=max_depth)
+
+        async def run(max_depth):
+            return await asyncio.ensure_future(capture(max_depth))
+
+        async def main(max_depth=None):
+            return await run(max_depth)
+
+        self.assertEqual(["run", "main"],
+                         [frame.f_code.co_name
+                          for frame, _ in asyncio.run(main())])
+        stack = asyncio.run(main(1))
+        self.assertEqual(1, len(stack))
+        self.assertEqual("run", stack[0][0].f_code.co_name)
+
+    def test_current_async_stack_outside_task(self):
+        self.assertEqual(exception.current_stack(),
+                         exception.current_async_stack())
+
+
+def identical_handlers():
+    """ Return identical functions compiled from two different files. """
+    handlers = []
+    for name in ("moda", "modb"):
+        namespace = {}
+        exec(compile("def handler(x):\n    return 1 / x\n",
+                     "/tmp/cartola_%s.py" % name, "exec"), namespace)
+        handlers.append(namespace['handler'])
+    return handlers
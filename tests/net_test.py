@@ -19,9 +19,34 @@ Network functions tests
 """
 
 from cartola import net
+import asyncio
+import errno
+import os
+import shutil
+import socket
+import struct
+import threading
+import time
 import unittest
 
 
+def listening_socket():
+    """ Return a socket listening in a free local port. """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(16)
+    return server
+
+
+def closed_port():
+    """ Return a local port nobody is listening to. """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@unittest.skipIf(os.getenv("NOICMP"), "NOICMP environment variable set, "
+                 "probably the ICMP protocol is blocked in this host.")
 class NetworkTestCase(unittest.TestCase):
 
     def test_valid_host_ping(self):
@@ -39,3 +64,264 @@ class NetworkTestCase(unittest.TestCase):
     def test_invalid_host_up(self):
         """ Test if host will be up for invalid host and port conbination """
         self.assertFalse(net.is_host_up("candango.org", "8080"))
+
+
+class LocalHostUpTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = listening_socket()
+        self.port = self.server.getsockname()[1]
+        self.closed_port = closed_port()
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_is_host_up(self):
+        self.assertTrue(net.is_host_up("127.0.0.1", self.port, timeout=1))
+        self.assertFalse(net.is_host_up("127.0.0.1", self.closed_port,
+                                        timeout=1))
+
+    def test_scan_hosts(self):
+        targets = [("127.0.0.1", self.port), ("127.0.0.1", self.closed_port)]
+
+        async def scan():
+            return [status async for status in net.scan_hosts(
+                targets, timeout=1, concurrency=1)]
+        statuses = asyncio.run(scan())
+        self.assertEqual(2, len(statuses))
+        for status in statuses:
+            if status.port == self.port:
+                self.assertTrue(status.up)
+                self.assertIsNone(status.error)
+            else:
+                self.assertFalse(status.up)
+                self.assertIsInstance(status.error, OSError)
+
+    def test_scan_hosts_up(self):
+        self.assertEqual({
+            ("127.0.0.1", self.port): True,
+            ("127.0.0.1", self.closed_port): False,
+        }, net.scan_hosts_up([("127.0.0.1", self.port),
+                              ("127.0.0.1", self.closed_port)]))
+
+
+class PingTestCase(unittest.TestCase):
+
+    def test_icmp_echo_request(self):
+        packet = net._icmp_echo_request(1, 2, b"payload")
+        icmp_type, code, _, identifier, sequence = struct.unpack(
+            "!BBHHH", packet[:8])
+        self.assertEqual((net.ICMP_ECHO_REQUEST, 0, 1, 2),
+                         (icmp_type, code, identifier, sequence))
+        self.assertEqual(b"payload", packet[8:])
+        # A packet with a valid checksum sums to zero
+        self.assertEqual(0, net._icmp_checksum(packet))
+
+    def test_icmp_reply(self):
+        reply = struct.pack("!BBHHH", net.ICMP_ECHO_REPLY, 0, 0, 1, 2)
+        self.assertEqual((net.ICMP_ECHO_REPLY, 2), net._icmp_reply(reply))
+        # IPv4 header with options, 24 bytes, preceding the message
+        ip_header = b"\x46" + b"\x00" * 23
+        self.assertEqual((net.ICMP_ECHO_REPLY, 2),
+                         net._icmp_reply(ip_header + reply + b"payload"))
+        self.assertIsNone(net._icmp_reply(ip_header + reply[:4]))
+        self.assertIsNone(net._icmp_reply(b""))
+
+    def test_ping_invalid_host(self):
+        logging_disabled = net.logger.disabled
+        net.logger.disabled = True
+        try:
+            results = net.ping_hosts(["invalid.invalid"], timeout=0.5)
+        finally:
+            net.logger.disabled = logging_disabled
+        self.assertEqual(1, len(results))
+        self.assertEqual("invalid.invalid", results[0].host)
+        self.assertFalse(results[0].alive)
+        self.assertIsNone(results[0].latency)
+
+    @unittest.skipUnless(net.icmp_socket_available() or shutil.which("ping"),
+                         "Neither ICMP sockets nor the ping command are "
+                         "available")
+    def test_ping_localhost(self):
+        results = net.ping_hosts(["127.0.0.1", "localhost"])
+        self.assertEqual(["127.0.0.1", "localhost"],
+                         [result.host for result in results])
+        for result in results:
+            self.assertTrue(result.alive)
+            self.assertGreater(result.latency, 0)
+
+
+class ReachabilityCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.up = True
+        self.checks = 0
+
+    def clock(self):
+        return self.now
+
+    def checker(self, host, port):
+        self.checks += 1
+        return self.up
+
+    def test_ttl(self):
+        reachability = net.ReachabilityCache(ttl=5, checker=self.checker,
+                                             clock=self.clock)
+        self.assertTrue(reachability.is_up("localhost", 80))
+        self.now = 4
+        self.assertTrue(reachability.is_up("localhost", "80"))
+        self.assertEqual(1, self.checks)
+        self.now = 5
+        self.up = False
+        self.assertFalse(reachability.is_up("localhost", 80))
+        self.assertEqual({'hits': 1, 'checks': 2, 'coalesced': 0},
+                         reachability.stats)
+
+    def test_backoff(self):
+        self.up = False
+        reachability = net.ReachabilityCache(
+            backoff=1, max_backoff=4, checker=self.checker, clock=self.clock)
+        expected_backoffs = [1, 2, 4, 4]
+        for backoff in expected_backoffs:
+            self.assertFalse(reachability.is_up("localhost", 80))
+            self.now += backoff - 0.5
+            self.assertFalse(reachability.is_up("localhost", 80))
+            self.now += 0.5
+        self.assertEqual(4, self.checks)
+        self.assertEqual(4, reachability.failures("localhost", 80))
+        self.up = True
+        self.assertTrue(reachability.is_up("localhost", 80))
+        self.assertEqual(0, reachability.failures("localhost", 80))
+
+    def test_coalesced_checks(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_checker(host, port):
+            started.set()
+            release.wait(5)
+            return self.checker(host, port)
+        reachability = net.ReachabilityCache(checker=slow_checker)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            reachability.is_up("localhost", 80))) for _ in range(5)]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        while reachability.stats['coalesced'] < 4:
+            release.wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual([True] * 5, results)
+        self.assertEqual(1, self.checks)
+
+    def test_checker_os_error(self):
+        def failing_checker(host, port):
+            raise OSError("Name or service not known")
+        reachability = net.ReachabilityCache(checker=failing_checker)
+        self.assertFalse(reachability.is_up("invalid.invalid", 80))
+        self.assertEqual(1, reachability.failures("invalid.invalid", 80))
+
+
+class HostHealthTestCase(unittest.TestCase):
+
+    def test_latency_histogram(self):
+        histogram = net.LatencyHistogram(max_seconds=1)
+        for latency in (0.001, 0.002, 0.003, 0.1, 5):
+            histogram.record(latency)
+        self.assertEqual(5, histogram.count)
+        self.assertEqual(5, sum(histogram.buckets().values()))
+        # Bucket bounds have at most 25% of error
+        self.assertAlmostEqual(0.003, histogram.percentile(60),
+                               delta=0.003 * 0.25)
+        self.assertEqual(5, histogram.percentile(100))
+        snapshot = histogram.snapshot()
+        self.assertEqual(0.001, snapshot['min'])
+        self.assertEqual(5, snapshot['max'])
+        self.assertIsNone(net.LatencyHistogram().percentile(50))
+
+    def test_probe(self):
+        server = listening_socket()
+        port = server.getsockname()[1]
+        unused_port = closed_port()
+        health = net.HostHealth()
+        try:
+            self.assertTrue(health.probe("127.0.0.1", port))
+            self.assertTrue(health.probe("127.0.0.1", port))
+            self.assertFalse(health.probe("127.0.0.1", unused_port))
+        finally:
+            server.close()
+        snapshot = health.snapshot()
+        up_health = snapshot[("127.0.0.1", port)]
+        self.assertEqual(2, up_health['successes'])
+        self.assertEqual(1.0, up_health['success_ratio'])
+        self.assertEqual(2, up_health['latency']['count'])
+        down_health = snapshot[("127.0.0.1", unused_port)]
+        self.assertEqual(0.0, down_health['success_ratio'])
+        self.assertEqual(errno.ECONNREFUSED, down_health['last_error'])
+        self.assertEqual("ECONNREFUSED", down_health['last_error_name'])
+        self.assertIsNone(down_health['latency']['p50'])
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.server = listening_socket()
+        self.port = self.server.getsockname()[1]
+        self.pool = net.ConnectionPool(max_size=1, idle_timeout=10,
+                                       timeout=1, clock=lambda: self.now)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.close()
+
+    def test_reuse(self):
+        with self.pool.connection("127.0.0.1", self.port) as sock:
+            first_sock = sock
+        with self.pool.connection("127.0.0.1", self.port) as sock:
+            self.assertIs(first_sock, sock)
+        self.assertEqual({'created': 1, 'reused': 1, 'expired': 0,
+                          'discarded': 0, 'idle': 1}, self.pool.stats)
+
+    def test_max_size(self):
+        first_sock = self.pool.acquire("127.0.0.1", self.port)
+        second_sock = self.pool.acquire("127.0.0.1", self.port)
+        self.pool.release(first_sock)
+        self.pool.release(second_sock)
+        self.assertEqual(-1, second_sock.fileno())
+        self.assertEqual(1, self.pool.stats['idle'])
+
+    def test_idle_timeout(self):
+        self.pool.release(self.pool.acquire("127.0.0.1", self.port))
+        self.now = 11
+        self.pool.release(self.pool.acquire("127.0.0.1", self.port))
+        self.assertEqual(1, self.pool.stats['expired'])
+        self.now = 22
+        self.pool.prune()
+        self.assertEqual(2, self.pool.stats['expired'])
+        self.assertEqual(0, self.pool.stats['idle'])
+
+    def test_peer_closed(self):
+        self.pool.release(self.pool.acquire("127.0.0.1", self.port))
+        server_side, _ = self.server.accept()
+        server_side.close()
+        time.sleep(0.05)
+        with self.pool.connection("127.0.0.1", self.port):
+            pass
+        self.assertEqual(1, self.pool.stats['discarded'])
+        self.assertEqual(2, self.pool.stats['created'])
+
+    def test_error_closes_connection(self):
+        with self.assertRaises(RuntimeError):
+            with self.pool.connection("127.0.0.1", self.port) as sock:
+                raise RuntimeError()
+        self.assertEqual(-1, sock.fileno())
+        self.assertEqual(0, self.pool.stats['idle'])
+
+    def test_refused_connection(self):
+        with self.assertRaises(ConnectionRefusedError):
+            self.pool.acquire("127.0.0.1", closed_port())
@@ -33,10 +33,10 @@ def suite():
     alltests.addTests(testLoader.loadTestsFromModule(fs_test))
     alltests.addTests(testLoader.loadTestsFromModule(ftext_test))
     if os.getenv("NOICMP"):
-        logger.warning("NOICMP environment variable suppressing net_test case."
-                       " Probably the ICMP protocol is blocked in this host.")
-    else:
-        alltests.addTests(testLoader.loadTestsFromModule(net_test))
+        logger.warning("NOICMP environment variable suppressing net_test "
+                       "cases reaching external hosts. Probably the ICMP "
+                       "protocol is blocked in this host.")
+    alltests.addTests(testLoader.loadTestsFromModule(net_test))
     alltests.addTests(testLoader.loadTestsFromModule(pagination_test))
     alltests.addTests(testLoader.loadTestsFromModule(security_test))
     alltests.addTests(testLoader.loadTestsFromModule(sysexits_test))